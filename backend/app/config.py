@@ -23,10 +23,19 @@ class Settings(BaseSettings):
     
     # Database Settings
     database_url: str = "sqlite+aiosqlite:///./rais_sessions.db"
+    sqlite_read_pool_size: int = 4
+    
+    # Postgres (Supabase) connection pool settings
+    pg_pool_size: int = 20
+    pg_max_overflow: int = 40
+    pg_pool_recycle_seconds: int = 3600
+    pg_pool_pre_ping: bool = True
+    pg_command_timeout_seconds: int = 30
     
     # Processing Settings
     max_rows_per_file: int = 50000
     processing_timeout_seconds: int = 300
+    pipeline_workers: int = 0  # worker processes for parsing; 0 = one per CPU
     
     # Expected file patterns for validation
     expected_files: list[str] = [
@@ -3,22 +3,40 @@ RAIS Backend - Database Package
 """
 from app.db.session import (
     init_db,
+    close_db,
+    optimize_db,
     create_session,
+    create_sessions,
     update_session,
+    update_sessions,
+    session_batch,
+    update_session_and_save,
     get_session,
     save_processed_data,
     get_processed_data,
+    get_latest_kpis,
     get_latest_stats,
+    get_latest_stats_raw,
+    get_all_sessions,
     reset_db,
 )
 
 __all__ = [
     "init_db",
+    "close_db",
+    "optimize_db",
     "create_session",
+    "create_sessions",
     "update_session",
+    "update_sessions",
+    "session_batch",
+    "update_session_and_save",
     "get_session",
     "save_processed_data",
     "get_processed_data",
+    "get_latest_kpis",
     "get_latest_stats",
+    "get_latest_stats_raw",
+    "get_all_sessions",
     "reset_db",
 ]
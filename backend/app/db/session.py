@@ -3,9 +3,15 @@ RAIS Backend - Database Session Management
 Hybrid approach: SQLite for processing state, Supabase (Postgres) for persistent data storage
 """
 import aiosqlite
-import json
+import asyncio
+import hashlib
+import orjson
+import time
+import zstandard
+from contextlib import asynccontextmanager
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
 from uuid import UUID
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
@@ -13,6 +19,10 @@ from sqlalchemy import text
 from app.config import settings
 from app.models import ProcessingStatus
 
+# Enum <-> stored text lookups, built once (ProcessingStatus(value) scans the members)
+_STATUS_VALUES = {status: status.value for status in ProcessingStatus}
+_STATUS_FROM_VALUE = {status.value: status for status in ProcessingStatus}
+
 # SQLite path for temporary session state (ephemeral)
 SQLITE_DB_PATH = Path("./rais_sessions.db")
 
@@ -22,66 +32,598 @@ pg_engine = None
 if settings.database_url and settings.database_url.startswith("postgresql"):
     # Ensure usage of asyncpg driver, as default is psycopg2 (sync)
     db_url = settings.database_url.replace("postgresql://", "postgresql+asyncpg://")
-    pg_engine = create_async_engine(db_url, echo=False)
+    pg_engine = create_async_engine(
+        db_url,
+        echo=False,
+        pool_size=settings.pg_pool_size,
+        max_overflow=settings.pg_max_overflow,
+        pool_recycle=settings.pg_pool_recycle_seconds,
+        pool_pre_ping=settings.pg_pool_pre_ping,
+        connect_args={
+            # JIT compilation only adds latency for our small OLTP queries
+            "server_settings": {"jit": "off"},
+            "command_timeout": settings.pg_command_timeout_seconds,
+        },
+    )
 
-async def init_db():
-    """Initialize the SQLite database with required tables"""
-    async with aiosqlite.connect(SQLITE_DB_PATH) as db:
-        # Upload sessions table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS upload_sessions (
-                upload_id TEXT PRIMARY KEY,
-                status TEXT NOT NULL DEFAULT 'uploading',
-                progress_percent INTEGER DEFAULT 0,
-                current_stage TEXT DEFAULT 'Waiting',
-                files_received INTEGER DEFAULT 0,
-                files_processed INTEGER DEFAULT 0,
-                errors TEXT DEFAULT '[]',
-                started_at TEXT NOT NULL,
-                completed_at TEXT,
-                file_paths TEXT DEFAULT '[]',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+# Connection tuning applied to every SQLite connection.
+# journal_mode is persisted in the DB file; the rest are per-connection settings.
+SQLITE_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=10737418240;
+    PRAGMA cache_size=-65536;
+    PRAGMA busy_timeout=5000;
+    PRAGMA wal_autocheckpoint=10000;
+    PRAGMA journal_size_limit=67108864;
+    PRAGMA cache_spill=OFF;
+    PRAGMA analysis_limit=400;
+"""
+
+# Connections: a small pool of read-only connections checked out by the query
+# helpers, and one write connection owned exclusively by the background writer
+# task. Each aiosqlite connection runs one statement at a time on its own thread,
+# so the pool lets concurrent status polls proceed in parallel. Under WAL, reads
+# proceed concurrently with the writer and never wait on its commits/checkpoints.
+_readers: list[aiosqlite.Connection] = []
+_read_pool: asyncio.Queue | None = None
+_write_db: aiosqlite.Connection | None = None
+
+# Writer task: request handlers enqueue (statements, future) and await the future.
+# The writer drains up to WRITE_BATCH_SIZE ops per tick into one transaction.
+WRITE_BATCH_SIZE = 64
+_write_queue: asyncio.Queue | None = None
+_writer_task: asyncio.Task | None = None
+
+# WAL checkpoints run off the hot path on their own connection; the raised
+# wal_autocheckpoint above keeps commits from triggering them inline.
+CHECKPOINT_INTERVAL_SECONDS = 60
+_checkpoint_db: aiosqlite.Connection | None = None
+_checkpoint_task: asyncio.Task | None = None
+
+# Hot statements. sqlite3 caches prepared statements per connection keyed by the
+# SQL text, so with persistent connections each of these is parsed/planned once;
+# init_db() warms them so the first request doesn't pay for it either.
+_SQL_GET_SESSION = "SELECT * FROM upload_sessions WHERE upload_id = ?"
+
+_SQL_UPSERT_PROCESSED = """
+    INSERT INTO processed_data (
+        upload_id, raw_data, validated_data, computed_stats,
+        rejection_rate, yield_rate, total_produced, total_rejected,
+        financial_loss, watch_batches, generated_at,
+        records_valid, records_invalid, detected_file_type
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(upload_id) DO UPDATE SET
+        raw_data = COALESCE(excluded.raw_data, raw_data),
+        validated_data = COALESCE(excluded.validated_data, validated_data),
+        computed_stats = COALESCE(excluded.computed_stats, computed_stats),
+        rejection_rate = COALESCE(excluded.rejection_rate, rejection_rate),
+        yield_rate = COALESCE(excluded.yield_rate, yield_rate),
+        total_produced = COALESCE(excluded.total_produced, total_produced),
+        total_rejected = COALESCE(excluded.total_rejected, total_rejected),
+        financial_loss = COALESCE(excluded.financial_loss, financial_loss),
+        watch_batches = COALESCE(excluded.watch_batches, watch_batches),
+        generated_at = COALESCE(excluded.generated_at, generated_at),
+        records_valid = COALESCE(excluded.records_valid, records_valid),
+        records_invalid = COALESCE(excluded.records_invalid, records_invalid),
+        detected_file_type = COALESCE(excluded.detected_file_type, detected_file_type)
+"""
+
+_SQL_INSERT_SESSION = """
+    INSERT INTO upload_sessions (upload_id, status, files_received, started_at)
+    VALUES (?, ?, ?, ?)
+"""
+
+# One fixed statement for every combination of session fields so SQLite's
+# statement cache always hits; NULL parameters leave the column unchanged
+_SQL_UPDATE_SESSION = """
+    UPDATE upload_sessions SET
+        status = COALESCE(?, status),
+        progress_percent = COALESCE(?, progress_percent),
+        current_stage = COALESCE(?, current_stage),
+        files_processed = COALESCE(?, files_processed),
+        errors = COALESCE(?, errors),
+        completed_at = COALESCE(?, completed_at)
+    WHERE upload_id = ?
+"""
+
+_SQL_LATEST_STATS = """
+    SELECT computed_stats, rejection_rate, yield_rate, total_produced, total_rejected,
+           financial_loss, watch_batches, generated_at
+    FROM processed_data WHERE computed_stats IS NOT NULL
+    ORDER BY created_at DESC LIMIT 1
+"""
+
+async def _connect(readonly: bool = False, **kwargs) -> aiosqlite.Connection:
+    """Open a SQLite connection with the WAL/performance PRAGMAs applied"""
+    if readonly:
+        # mode=ro never takes a write lock; query_only also rejects writes at prepare time
+        db = await aiosqlite.connect(f"{SQLITE_DB_PATH.resolve().as_uri()}?mode=ro", uri=True, **kwargs)
+    else:
+        db = await aiosqlite.connect(SQLITE_DB_PATH, **kwargs)
+    db.row_factory = aiosqlite.Row
+    await db.executescript(SQLITE_PRAGMAS)
+    if readonly:
+        await db.execute("PRAGMA query_only=1")
+    return db
+
+@asynccontextmanager
+async def _reader():
+    """Check out a read-only connection from the pool for the duration of the block"""
+    if _read_pool is None:
+        raise RuntimeError("Database not initialized - call init_db() first")
+    db = await _read_pool.get()
+    try:
+        yield db
+    finally:
+        _read_pool.put_nowait(db)
+
+class _Many(NamedTuple):
+    """A statement run once per parameter row with executemany"""
+    sql: str
+    rows: list[tuple]
+
+async def _write(*statements: tuple[str, tuple | list] | _Many):
+    """Queue statements to run atomically on the writer task and wait for the commit"""
+    if _write_queue is None:
+        raise RuntimeError("Database not initialized - call init_db() first")
+    if _writer_task.done():
+        raise RuntimeError("SQLite writer has stopped - restart the app to reopen the database")
+    future = asyncio.get_running_loop().create_future()
+    await _write_queue.put((statements, future))
+    await future
+
+async def _writer_loop(db: aiosqlite.Connection):
+    """Single writer: batch queued ops into one BEGIN IMMEDIATE ... COMMIT"""
+    ops = []
+    try:
+        while True:
+            ops = [await _write_queue.get()]
+            while len(ops) < WRITE_BATCH_SIZE and not _write_queue.empty():
+                ops.append(_write_queue.get_nowait())
+            stop = None in ops
+            ops = [op for op in ops if op is not None]
+            if ops:
+                await _run_batch(db, ops)
+            ops = []
+            if stop:
+                return
+    except BaseException as e:
+        # The writer is gone: fail everything in hand or still queued so no caller waits forever
+        print(f"SQLite writer stopped: {e!r}")
+        error = e if isinstance(e, Exception) else RuntimeError("SQLite writer stopped")
+        while not _write_queue.empty():
+            ops.append(_write_queue.get_nowait())
+        for op in ops:
+            if op is not None and not op[1].done():
+                op[1].set_exception(error)
+        raise
+
+async def _run_batch(db: aiosqlite.Connection, ops: list):
+    """Run one batch of ops in a single transaction and resolve their futures"""
+    outcomes = []
+    try:
+        await db.execute("BEGIN IMMEDIATE")
+        for statements, future in ops:
+            # Savepoint per op so one failing op doesn't undo the rest of the batch
+            await db.execute("SAVEPOINT op")
+            try:
+                for statement in statements:
+                    if isinstance(statement, _Many):
+                        await db.executemany(statement.sql, statement.rows)
+                    else:
+                        await db.execute(*statement)
+                await db.execute("RELEASE op")
+                outcomes.append((future, None))
+            except Exception as e:
+                await db.execute("ROLLBACK TO op")
+                await db.execute("RELEASE op")
+                outcomes.append((future, e))
+        await db.execute("COMMIT")
+    except Exception as e:
+        if db.in_transaction:
+            await db.execute("ROLLBACK")
+        outcomes = [(future, e) for _, future in ops]
+
+    for future, error in outcomes:
+        if future.done():
+            continue
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+async def _checkpoint_loop(db: aiosqlite.Connection):
+    """Periodically checkpoint and truncate the WAL from a dedicated connection"""
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL_SECONDS)
+        try:
+            await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception as e:
+            print(f"WAL checkpoint failed: {e}")
+
+async def close_db():
+    """Flush pending writes and close the SQLite connections (called on app shutdown)"""
+    global _write_queue, _writer_task, _checkpoint_task, _kpi_queue, _kpi_task
+    if _kpi_task is not None:
+        # Send buffered KPI snapshots to Supabase before shutting down
+        _kpi_queue.put_nowait(None)
+        await _kpi_task
+        _kpi_task = None
+        _kpi_queue = None
+    if _checkpoint_task is not None:
+        _checkpoint_task.cancel()
+        try:
+            await _checkpoint_task
+        except asyncio.CancelledError:
+            pass
+        _checkpoint_task = None
+    try:
+        if _writer_task is not None:
+            if not _writer_task.done():
+                await _write_queue.put(None)
+            await _writer_task
+            # Leave fresh planner statistics for the next start
+            try:
+                await _write_db.execute(_SQL_OPTIMIZE)
+            except Exception as e:
+                print(f"PRAGMA optimize failed: {e}")
+    finally:
+        _writer_task = None
+        _write_queue = None
+        await _close_connections()
+
+# The readers are read-only, so statistics are refreshed from the writer. Its own
+# statements never touch the read indexes, so optimize must consider every table
+# (0x10000, SQLite 3.46+); older libraries fall back to an ANALYZE, kept cheap by
+# analysis_limit (a bounded sample of rows per index).
+if aiosqlite.sqlite_version_info >= (3, 46, 0):
+    _SQL_OPTIMIZE = "PRAGMA optimize=0x10002"
+else:
+    _SQL_OPTIMIZE = "ANALYZE"
+
+async def optimize_db():
+    """Refresh query-planner statistics (sqlite_stat1) where they are stale"""
+    await _write((_SQL_OPTIMIZE, ()))
+
+async def _close_connections():
+    """Close the reader, writer and checkpoint connections and clear the handles"""
+    global _readers, _read_pool, _write_db, _checkpoint_db
+    for conn in (*_readers, _write_db, _checkpoint_db):
+        if conn is not None:
+            await conn.close()
+    _readers = []
+    _read_pool = None
+    _write_db = None
+    _checkpoint_db = None
+
+# In-process cache of the newest row with computed stats: its stats blob and KPI
+# columns, loaded by one query so get_latest_stats() and get_latest_kpis() always
+# agree. Writes invalidate it; the TTL bounds staleness if another process writes the DB.
+LATEST_STATS_TTL_SECONDS = 300
+_latest_cache: tuple[bytes, dict] | None = None  # (decompressed stats JSON, KPI columns)
+_latest_cache_ts: float = 0.0
+_latest_cache_gen = 0
+
+def _invalidate_latest_cache():
+    global _latest_cache, _latest_cache_gen
+    _latest_cache = None
+    # A load that started before this write must not repopulate the cache
+    _latest_cache_gen += 1
+
+async def _load_latest() -> tuple[bytes, dict] | None:
+    """Return (computed_stats JSON bytes, KPI columns) of the newest row with stats"""
+    global _latest_cache, _latest_cache_ts
+    if _latest_cache is not None and time.monotonic() - _latest_cache_ts < LATEST_STATS_TTL_SECONDS:
+        return _latest_cache
+
+    gen = _latest_cache_gen
+    async with _reader() as db:
+        async with db.execute(_SQL_LATEST_STATS) as cursor:
+            row = await cursor.fetchone()
+    if not row:
+        return None
+    # Decompress once here so cache hits only pay for orjson.loads
+    latest = (_json_bytes(row["computed_stats"]), {name: row[name] for name in KPI_COLUMNS})
+    if gen == _latest_cache_gen:
+        _latest_cache = latest
+        _latest_cache_ts = time.monotonic()
+    return latest
+
+def _dumps(obj) -> bytes:
+    """Serialize to JSON bytes with orjson (bound directly as a BLOB, no str round-trip)"""
+    return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+# raw_data and computed_stats are large and repetitive, so they are stored zstd-compressed.
+# Rows written before that hold plain JSON; the frame magic tells the two apart.
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_ZSTD_LEVEL = 3
+_zstd_decompressor = zstandard.ZstdDecompressor()
+
+def _dumps_compressed(obj) -> bytes:
+    """Serialize to JSON and zstd-compress (thread-safe: no shared compressor)"""
+    return zstandard.compress(_dumps(obj), _ZSTD_LEVEL)
+
+# Session errors are almost always empty: skip orjson for that case both ways
+_EMPTY_ERRORS = "[]"
+
+def _dumps_errors(errors: list[str]) -> str:
+    return orjson.dumps(errors).decode() if errors else _EMPTY_ERRORS
+
+def _loads_errors(text: str) -> list[str]:
+    return [] if text == _EMPTY_ERRORS else orjson.loads(text)
+
+def _json_bytes(blob: bytes | str) -> bytes | str:
+    """Return the JSON held in a stored column, decompressing zstd frames"""
+    if blob[:4] == _ZSTD_MAGIC:
+        return _zstd_decompressor.decompress(blob)
+    return blob
+
+def _loads_blob(blob: bytes | str):
+    """Decode a stored JSON column, decompressing zstd frames"""
+    return orjson.loads(_json_bytes(blob))
+
+# KPI scalars extracted from computed_stats so the overview read needs no JSON parsing
+KPI_COLUMNS = {
+    "rejection_rate": "REAL",
+    "yield_rate": "REAL",
+    "total_produced": "INTEGER",
+    "total_rejected": "INTEGER",
+    "financial_loss": "REAL",
+    "watch_batches": "INTEGER",
+    "generated_at": "TEXT",
+}
+
+# Upload summary scalars extracted from validated_data/raw_data for the history listing
+SUMMARY_COLUMNS = {
+    "records_valid": "INTEGER",
+    "records_invalid": "INTEGER",
+    "detected_file_type": "TEXT",
+}
+
+async def _add_missing_columns(db: aiosqlite.Connection, table: str, columns: dict[str, str]) -> list[str]:
+    """Add columns introduced after a database file was first created; returns the added names"""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        existing = {row["name"] for row in await cursor.fetchall()}
+    added = []
+    for name, col_type in columns.items():
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+            added.append(name)
+    return added
+
+# Table definitions, formatted with the table name so migrations can build a replacement table.
+# Timestamps are INTEGER unix milliseconds (UTC); unixepoch('subsec') needs SQLite 3.42+,
+# so the created_at default is computed from julianday().
+_TABLE_DDL = {
+    # Upload sessions table
+    "upload_sessions": """
+        CREATE TABLE IF NOT EXISTS {name} (
+            upload_id BLOB PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'uploading',
+            progress_percent INTEGER DEFAULT 0,
+            current_stage TEXT DEFAULT 'Waiting',
+            files_received INTEGER DEFAULT 0,
+            files_processed INTEGER DEFAULT 0,
+            errors TEXT DEFAULT '[]' CHECK (json_valid(errors)),
+            started_at INTEGER NOT NULL,
+            completed_at INTEGER,
+            file_paths TEXT DEFAULT '[]',
+            created_at INTEGER DEFAULT (CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))
+        )
+    """,
+    # Processed data table (stores computed stats as JSON bytes)
+    "processed_data": """
+        CREATE TABLE IF NOT EXISTS {name} (
+            upload_id BLOB PRIMARY KEY,
+            raw_data BLOB,
+            validated_data BLOB,
+            computed_stats BLOB,
+            rejection_rate REAL,
+            yield_rate REAL,
+            total_produced INTEGER,
+            total_rejected INTEGER,
+            financial_loss REAL,
+            watch_batches INTEGER,
+            generated_at TEXT,
+            records_valid INTEGER,
+            records_invalid INTEGER,
+            detected_file_type TEXT,
+            created_at INTEGER DEFAULT (CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)),
+            FOREIGN KEY (upload_id) REFERENCES upload_sessions(upload_id)
+        )
+    """,
+}
+
+_EPOCH = datetime(1970, 1, 1)
+_MS = timedelta(milliseconds=1)
+
+def _now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+def _to_ms(dt: datetime) -> int:
+    """Unix milliseconds for a datetime; naive values are UTC (the app uses datetime.utcnow())"""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // _MS
+
+def _from_ms(ms: int | None) -> datetime | None:
+    """Naive UTC datetime for stored unix milliseconds"""
+    return _EPOCH + ms * _MS if ms is not None else None
+
+async def _migrate_text_upload_ids(db: aiosqlite.Connection):
+    """One-time rewrite of legacy TEXT upload_ids (36-char UUID strings) to 16-byte BLOBs"""
+    for table in ("upload_sessions", "processed_data"):
+        async with db.execute(f"SELECT upload_id FROM {table} WHERE typeof(upload_id) = 'text'") as cursor:
+            rows = await cursor.fetchall()
+        if rows:
+            await db.executemany(
+                f"UPDATE {table} SET upload_id = ? WHERE upload_id = ?",
+                [(UUID(row["upload_id"]).bytes, row["upload_id"]) for row in rows]
             )
-        """)
-        
-        # Processed data table (stores computed stats as JSON)
+
+# Columns that held ISO-8601 TEXT before timestamps moved to INTEGER unix ms
+_TIMESTAMP_COLUMNS = {
+    "upload_sessions": ("started_at", "completed_at", "created_at"),
+    "processed_data": ("created_at",),
+}
+
+async def _migrate_text_timestamps(db: aiosqlite.Connection):
+    """One-time rebuild of tables created with TEXT timestamps into INTEGER unix-ms columns"""
+    # Column affinity can't be altered in place: a TEXT column would store the integers as text
+    for table, ts_columns in _TIMESTAMP_COLUMNS.items():
+        async with db.execute(f"PRAGMA table_info({table})") as cursor:
+            columns = [(row["name"], row["type"]) for row in await cursor.fetchall()]
+        if dict(columns)["created_at"].upper() != "TEXT":
+            continue
+        names = [name for name, _ in columns]
+        select = ", ".join(
+            f"CAST(round((julianday({name}) - 2440587.5) * 86400000) AS INTEGER)" if name in ts_columns else name
+            for name in names
+        )
+        await db.execute(_TABLE_DDL[table].format(name=f"{table}_new"))
+        await db.execute(f"INSERT INTO {table}_new ({', '.join(names)}) SELECT {select} FROM {table}")
+        await db.execute(f"DROP TABLE {table}")
+        await db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+def _detect_file_type(raw_data: dict | None) -> str | None:
+    """Pick the file type from raw_data keys (first key that is not 'unknown')"""
+    if not raw_data:
+        return None
+    # Raw data keys are file types (e.g. "production_cumulative": [...])
+    for k in raw_data.keys():
+        if k != "unknown":
+            return k
+    return next(iter(raw_data), None)
+
+def _summary_values(raw_data: dict | None, validated_data: dict | None) -> tuple:
+    """Extract SUMMARY_COLUMNS values from the raw/validated payloads"""
+    records_valid = validated_data.get("valid_rows", 0) if validated_data else None
+    records_invalid = validated_data.get("error_rows", 0) if validated_data else None
+    return (records_valid, records_invalid, _detect_file_type(raw_data))
+
+async def _backfill_summary_columns(db: aiosqlite.Connection):
+    """One-time fill of SUMMARY_COLUMNS for rows saved before they existed"""
+    async with db.execute("SELECT upload_id, raw_data, validated_data FROM processed_data") as cursor:
+        rows = await cursor.fetchall()
+    for row in rows:
+        try:
+            raw = _loads_blob(row["raw_data"]) if row["raw_data"] else None
+            validated = orjson.loads(row["validated_data"]) if row["validated_data"] else None
+        except orjson.JSONDecodeError:
+            continue
+        await db.execute(
+            "UPDATE processed_data SET records_valid = ?, records_invalid = ?, detected_file_type = ? WHERE upload_id = ?",
+            (*_summary_values(raw, validated), row["upload_id"])
+        )
+
+def _kpi_values(computed_stats: dict | None) -> tuple:
+    """Extract KPI column values (in KPI_COLUMNS order) from a computed stats dict"""
+    if not computed_stats:
+        return (None,) * len(KPI_COLUMNS)
+    kpis = computed_stats.get("kpis") or {}
+    generated_at = computed_stats.get("generated_at")
+    return (
+        kpis.get("rejection_rate"),
+        kpis.get("yield_rate"),
+        kpis.get("total_produced"),
+        kpis.get("total_rejected"),
+        kpis.get("financial_impact", kpis.get("financial_loss")),
+        kpis.get("watch_batches"),
+        str(generated_at) if generated_at is not None else None,
+    )
+
+async def init_db():
+    """Initialize the SQLite database with required tables and start the writer task"""
+    global _read_pool, _write_db, _checkpoint_db, _write_queue, _writer_task, _checkpoint_task
+    if _writer_task is not None:
+        return
+
+    # Autocommit mode: the writer issues BEGIN IMMEDIATE/COMMIT itself
+    db = _write_db = await _connect(isolation_level=None)
+    try:
+        await db.execute("BEGIN IMMEDIATE")
+        await db.execute(_TABLE_DDL["upload_sessions"].format(name="upload_sessions"))
+        await db.execute(_TABLE_DDL["processed_data"].format(name="processed_data"))
+        await _migrate_text_upload_ids(db)
+        await _add_missing_columns(db, "processed_data", KPI_COLUMNS)
+        if await _add_missing_columns(db, "processed_data", SUMMARY_COLUMNS):
+            await _backfill_summary_columns(db)
+        await _migrate_text_timestamps(db)
+    
+        # Indexes for the dashboard's "latest" / history queries
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_created ON upload_sessions(created_at DESC)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_processed_created ON processed_data(created_at DESC)")
         await db.execute("""
-            CREATE TABLE IF NOT EXISTS processed_data (
-                upload_id TEXT PRIMARY KEY,
-                raw_data TEXT,
-                validated_data TEXT,
-                computed_stats TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (upload_id) REFERENCES upload_sessions(upload_id)
-            )
+            CREATE INDEX IF NOT EXISTS idx_processed_stats_notnull
+            ON processed_data(created_at DESC) WHERE computed_stats IS NOT NULL
         """)
-        
-        await db.commit()
+
+        # Prepare the UPSERT on the writer connection; the dummy row is rolled back
+        await db.execute("SAVEPOINT warm")
+        await db.execute(_SQL_UPSERT_PROCESSED, (b"",) + (None,) * 13)
+        await db.execute(_SQL_UPDATE_SESSION, (None,) * 6 + (b"",))
+        await db.execute("ROLLBACK TO warm")
+        await db.execute("RELEASE warm")
+        await db.execute("COMMIT")
+
+        # The schema exists now, so the readers can open the file read-only
+        for _ in range(settings.sqlite_read_pool_size):
+            reader = await _connect(readonly=True)
+            _readers.append(reader)
+            await _warm_statements(reader)
+        _read_pool = asyncio.Queue()
+        for reader in _readers:
+            _read_pool.put_nowait(reader)
+        _checkpoint_db = await _connect()
+    except BaseException:
+        # Don't leak the connections: a retried init_db() opens fresh ones
+        try:
+            if db.in_transaction:
+                await db.execute("ROLLBACK")
+        finally:
+            await _close_connections()
+        raise
+    _write_queue = asyncio.Queue()
+    _writer_task = asyncio.create_task(_writer_loop(_write_db))
+    _checkpoint_task = asyncio.create_task(_checkpoint_loop(_checkpoint_db))
 
     # Initialize Postgres tables if connected
     if pg_engine:
         pass # Schema is managed via Supabase / SQL scripts, so we don't auto-create tables here to avoid conflicts
 
+async def _warm_statements(db: aiosqlite.Connection):
+    """Run the hot read queries once so their prepared statements are cached"""
+    for sql, params in (
+        (_SQL_GET_SESSION, (b"",)),
+        (_SQL_LATEST_STATS, ()),
+    ):
+        async with db.execute(sql, params) as cursor:
+            await cursor.fetchall()
+
 async def create_session(upload_id: UUID, files_received: int) -> dict:
     """Create a new upload session"""
-    async with aiosqlite.connect(SQLITE_DB_PATH) as db:
-        now = datetime.utcnow().isoformat()
-        await db.execute(
-            """
-            INSERT INTO upload_sessions 
-            (upload_id, status, files_received, started_at)
-            VALUES (?, ?, ?, ?)
-            """,
-            (str(upload_id), ProcessingStatus.UPLOADING.value, files_received, now)
-        )
-        await db.commit()
-        
-    return {
-        "upload_id": upload_id,
-        "status": ProcessingStatus.UPLOADING,
-        "files_received": files_received,
-        "started_at": now
-    }
+    return (await create_sessions([(upload_id, files_received)]))[0]
+
+async def create_sessions(items: list[tuple[UUID, int]]) -> list[dict]:
+    """Create several upload sessions with one executemany and one commit"""
+    now = _now_ms()
+    await _write(_Many(
+        _SQL_INSERT_SESSION,
+        [(upload_id.bytes, _STATUS_VALUES[ProcessingStatus.UPLOADING], files_received, now) for upload_id, files_received in items]
+    ))
+    started_at = _from_ms(now)
+    return [
+        {
+            "upload_id": upload_id,
+            "status": ProcessingStatus.UPLOADING,
+            "files_received": files_received,
+            "started_at": started_at
+        }
+        for upload_id, files_received in items
+    ]
 
 async def update_session(
     upload_id: UUID,
@@ -93,145 +635,258 @@ async def update_session(
     completed_at: datetime = None
 ):
     """Update session status"""
-    async with aiosqlite.connect(SQLITE_DB_PATH) as db:
-        updates = []
-        params = []
-        
-        if status is not None:
-            updates.append("status = ?")
-            params.append(status.value)
-        if progress_percent is not None:
-            updates.append("progress_percent = ?")
-            params.append(progress_percent)
-        if current_stage is not None:
-            updates.append("current_stage = ?")
-            params.append(current_stage)
-        if files_processed is not None:
-            updates.append("files_processed = ?")
-            params.append(files_processed)
-        if errors is not None:
-            updates.append("errors = ?")
-            params.append(json.dumps(errors))
-        if completed_at is not None:
-            updates.append("completed_at = ?")
-            params.append(completed_at.isoformat())
-        
-        if updates:
-            params.append(str(upload_id))
-            await db.execute(
-                f"UPDATE upload_sessions SET {', '.join(updates)} WHERE upload_id = ?",
-                params
-            )
-            await db.commit()
+    statement = _session_update(
+        upload_id, status, progress_percent, current_stage, files_processed, errors, completed_at
+    )
+    if statement:
+        await _write(statement)
+
+async def update_sessions(updates: list[tuple[UUID, dict]]):
+    """
+    Apply update_session field updates to several sessions at once.
+    
+    Every update binds the same constant UPDATE, so the batch is one
+    executemany in one transaction, e.g. per-file progress heartbeats.
+    """
+    rows = []
+    for upload_id, fields in updates:
+        statement = _session_update(upload_id, **fields)
+        if statement:
+            rows.append(statement[1])
+    if rows:
+        await _write(_Many(_SQL_UPDATE_SESSION, rows))
+
+def _session_update(
+    upload_id: UUID,
+    status: ProcessingStatus = None,
+    progress_percent: int = None,
+    current_stage: str = None,
+    files_processed: int = None,
+    errors: list[str] = None,
+    completed_at: datetime = None
+) -> tuple[str, tuple] | None:
+    """Bind the supplied session fields to the constant UPDATE (None if nothing to change)"""
+    params = (
+        _STATUS_VALUES[status] if status is not None else None,
+        progress_percent,
+        current_stage,
+        files_processed,
+        _dumps_errors(errors) if errors is not None else None,
+        _to_ms(completed_at) if completed_at is not None else None,
+    )
+    if all(p is None for p in params):
+        return None
+    return _SQL_UPDATE_SESSION, (*params, upload_id.bytes)
+
+class SessionBatch:
+    """Accumulates session field updates; later values for a field win"""
+    def __init__(self, upload_id: UUID):
+        self.upload_id = upload_id
+        self.fields: dict = {}
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+@asynccontextmanager
+async def session_batch(upload_id: UUID):
+    """
+    Coalesce several session updates into a single UPDATE + commit.
+
+    Usage:
+        async with session_batch(upload_id) as s:
+            s.set(progress_percent=40, current_stage="Parsed")
+            ...
+            s.set(status=ProcessingStatus.VALIDATING, progress_percent=50)
+
+    Nothing is written if the block raises.
+    """
+    batch = SessionBatch(upload_id)
+    yield batch
+    if batch.fields:
+        await update_session(upload_id, **batch.fields)
 
 async def get_session(upload_id: UUID) -> dict | None:
     """Get session by ID"""
-    async with aiosqlite.connect(SQLITE_DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT * FROM upload_sessions WHERE upload_id = ?",
-            (str(upload_id),)
-        ) as cursor:
+    async with _reader() as db:
+        async with db.execute(_SQL_GET_SESSION, (upload_id.bytes,)) as cursor:
             row = await cursor.fetchone()
             if row:
                 return {
-                    "upload_id": UUID(row["upload_id"]),
-                    "status": ProcessingStatus(row["status"]),
+                    "upload_id": UUID(bytes=row["upload_id"]),
+                    "status": _STATUS_FROM_VALUE[row["status"]],
                     "progress_percent": row["progress_percent"],
                     "current_stage": row["current_stage"],
                     "files_received": row["files_received"],
                     "files_processed": row["files_processed"],
-                    "errors": json.loads(row["errors"]),
-                    "started_at": datetime.fromisoformat(row["started_at"]),
-                    "completed_at": datetime.fromisoformat(row["completed_at"]) if row["completed_at"] else None
+                    "errors": _loads_errors(row["errors"]),
+                    "started_at": _from_ms(row["started_at"]),
+                    "completed_at": _from_ms(row["completed_at"])
                 }
             return None
 
+def _processed_upsert(upload_id: UUID, raw_data: dict | None, validated_data: dict | None, computed_stats: dict | None) -> tuple[str, tuple]:
+    """Build the processed_data UPSERT; fields not supplied (NULL) keep their stored value"""
+    raw_json = _dumps_compressed(raw_data) if raw_data else None
+    val_json = _dumps(validated_data) if validated_data else None
+    stats_json = _dumps_compressed(computed_stats) if computed_stats else None
+    return (
+        _SQL_UPSERT_PROCESSED,
+        (
+            upload_id.bytes, raw_json, val_json, stats_json,
+            *_kpi_values(computed_stats),
+            *_summary_values(raw_data, validated_data)
+        )
+    )
+
+def _after_stats_saved(computed_stats: dict | None):
+    """Bookkeeping once new computed stats are committed to SQLite"""
+    if not computed_stats:
+        return
+    # "Latest" is ordered by row creation, which need not be this row - reload on next read
+    _invalidate_latest_cache()
+    # Supabase sync is non-blocking: queued only once SQLite has the data, so a
+    # failed upload never reaches Supabase; flush failures are logged, not raised
+    if pg_engine:
+        _queue_pg_kpis(computed_stats)
+
+# Supabase KPI snapshots are buffered and flushed by a background task: concurrent
+# saves share one multi-row insert instead of opening a transaction each.
+KPI_FLUSH_INTERVAL_SECONDS = 0.5
+KPI_FLUSH_MAX_ROWS = 1000
+_kpi_queue: asyncio.Queue | None = None
+_kpi_task: asyncio.Task | None = None
+
+# Digest of the last KPI snapshot queued for Supabase; an identical snapshot is skipped
+_last_kpi_digest: bytes | None = None
+
+_SQL_INSERT_KPIS = text("""
+    INSERT INTO analytics_kpis (
+        rejection_rate, total_produced, total_rejected, yield_rate, financial_loss
+    ) VALUES (:rr, :tp, :tr, :yr, :fl)
+""")
+
+def _queue_pg_kpis(computed_stats: dict):
+    """Buffer the KPI snapshot for the next Supabase (Postgres) flush"""
+    global _last_kpi_digest, _kpi_queue, _kpi_task
+    if 'kpis' not in computed_stats:
+        return
+    kpis = computed_stats['kpis']
+    params = {
+        "rr": kpis.get('rejection_rate'),
+        "tp": kpis.get('total_produced'),
+        "tr": kpis.get('total_rejected'),
+        "yr": kpis.get('yield_rate'),
+        "fl": kpis.get('financial_loss')
+    }
+    # Repeat saves of the same KPIs would only duplicate history rows - skip them
+    digest = hashlib.blake2b(orjson.dumps(params, option=orjson.OPT_SORT_KEYS), digest_size=16).digest()
+    if digest == _last_kpi_digest:
+        return
+    _last_kpi_digest = digest
+
+    if _kpi_task is None:
+        _kpi_queue = asyncio.Queue()
+        _kpi_task = asyncio.create_task(_kpi_flush_loop())
+    _kpi_queue.put_nowait(params)
+
+async def _kpi_flush_loop():
+    """Drain buffered KPI rows into Supabase, one round-trip per batch"""
+    while True:
+        rows = [await _kpi_queue.get()]
+        if rows[0] is not None:
+            # Linger briefly so snapshots from a burst of uploads share the insert
+            await asyncio.sleep(KPI_FLUSH_INTERVAL_SECONDS)
+        while len(rows) < KPI_FLUSH_MAX_ROWS and not _kpi_queue.empty():
+            rows.append(_kpi_queue.get_nowait())
+        stop = None in rows
+        rows = [row for row in rows if row is not None]
+        if rows:
+            await _flush_pg_kpis(rows)
+        if stop:
+            return
+
+async def _flush_pg_kpis(rows: list[dict]):
+    """Insert a batch of KPI snapshots; failures are logged, never raised"""
+    global _last_kpi_digest
+    try:
+        async with pg_engine.begin() as conn:
+            # executemany: asyncpg sends the whole batch in one round-trip
+            await conn.execute(_SQL_INSERT_KPIS, rows)
+            
+            # We could add more specific inserts for other tables from your schema here
+            # For now, we are persisting the critical KPIs which drives the dashboard history
+    except Exception as e:
+        # Nothing was written, so don't suppress the next snapshot as a duplicate
+        _last_kpi_digest = None
+        print(f"Supabase Sync Failed: {e}")
+
+async def _encode_processed(upload_id: UUID, raw_data: dict | None, validated_data: dict | None, computed_stats: dict | None) -> tuple[str, tuple]:
+    """Build the processed_data UPSERT in the default executor - large payloads would block the loop while encoding"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, _processed_upsert, upload_id, raw_data, validated_data, computed_stats
+    )
+
 async def save_processed_data(upload_id: UUID, raw_data: dict = None, validated_data: dict = None, computed_stats: dict = None):
     """Save processed data for a session (SQLite) AND sync to Supabase (Postgres)"""
-    
-    # 1. Save to SQLite (Immediate Cache)
-    async with aiosqlite.connect(SQLITE_DB_PATH) as db:
-        async with db.execute("SELECT upload_id FROM processed_data WHERE upload_id = ?", (str(upload_id),)) as cursor:
-            exists = await cursor.fetchone()
-        
-        raw_json = json.dumps(raw_data, default=str) if raw_data else None
-        val_json = json.dumps(validated_data, default=str) if validated_data else None
-        stats_json = json.dumps(computed_stats, default=str) if computed_stats else None
-
-        if exists:
-            updates = []
-            params = []
-            if raw_data: 
-                updates.append("raw_data = ?")
-                params.append(raw_json)
-            if validated_data:
-                updates.append("validated_data = ?")
-                params.append(val_json)
-            if computed_stats:
-                updates.append("computed_stats = ?")
-                params.append(stats_json)
-            if updates:
-                params.append(str(upload_id))
-                await db.execute(f"UPDATE processed_data SET {', '.join(updates)} WHERE upload_id = ?", params)
-        else:
-            await db.execute(
-                "INSERT INTO processed_data (upload_id, raw_data, validated_data, computed_stats) VALUES (?, ?, ?, ?)",
-                (str(upload_id), raw_json, val_json, stats_json)
-            )
-        await db.commit()
+    # SQLite (Immediate Cache) failures are real errors
+    await _write(await _encode_processed(upload_id, raw_data, validated_data, computed_stats))
+    _after_stats_saved(computed_stats)
 
-    # 2. Sync to Supabase (Persistent Storage) if engine is configured
-    if pg_engine and computed_stats:
-        try:
-            async with pg_engine.begin() as conn:
-                # Insert KPI snapshot
-                if 'kpis' in computed_stats:
-                    kpis = computed_stats['kpis']
-                    await conn.execute(text("""
-                        INSERT INTO analytics_kpis (
-                            rejection_rate, total_produced, total_rejected, yield_rate, financial_loss
-                        ) VALUES (:rr, :tp, :tr, :yr, :fl)
-                    """), {
-                        "rr": kpis.get('rejection_rate'),
-                        "tp": kpis.get('total_produced'),
-                        "tr": kpis.get('total_rejected'),
-                        "yr": kpis.get('yield_rate'),
-                        "fl": kpis.get('financial_loss')
-                    })
-                
-                # We could add more specific inserts for other tables from your schema here
-                # For now, we are persisting the critical KPIs which drives the dashboard history
-        except Exception as e:
-            print(f"Supabase Sync Failed: {e}") 
-            # Non-blocking, we don't fail the request if sync fails, but we log it.
+async def update_session_and_save(upload_id: UUID, *, session_updates: dict, processed_payload: dict | None = None):
+    """
+    Apply session field updates and save processed data in one transaction.
+    
+    processed_payload takes the save_processed_data keywords (raw_data,
+    validated_data, computed_stats); session_updates takes update_session's.
+    """
+    payload = processed_payload or {}
+    statements = []
+    update = _session_update(upload_id, **session_updates)
+    if update:
+        statements.append(update)
+    if payload:
+        statements.append(await _encode_processed(
+            upload_id, payload.get("raw_data"), payload.get("validated_data"), payload.get("computed_stats")
+        ))
+    if statements:
+        # One writer op: both statements commit or roll back together
+        await _write(*statements)
+    _after_stats_saved(payload.get("computed_stats"))
 
 async def get_processed_data(upload_id: UUID) -> dict | None:
     """Get processed data by upload ID"""
-    async with aiosqlite.connect(SQLITE_DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM processed_data WHERE upload_id = ?", (str(upload_id),)) as cursor:
+    async with _reader() as db:
+        async with db.execute("SELECT * FROM processed_data WHERE upload_id = ?", (upload_id.bytes,)) as cursor:
             row = await cursor.fetchone()
             if row:
                 return {
-                    "raw_data": json.loads(row["raw_data"]) if row["raw_data"] else None,
-                    "validated_data": json.loads(row["validated_data"]) if row["validated_data"] else None,
-                    "computed_stats": json.loads(row["computed_stats"]) if row["computed_stats"] else None
+                    "raw_data": _loads_blob(row["raw_data"]) if row["raw_data"] else None,
+                    "validated_data": orjson.loads(row["validated_data"]) if row["validated_data"] else None,
+                    "computed_stats": _loads_blob(row["computed_stats"]) if row["computed_stats"] else None
                 }
             return None
 
+async def get_latest_kpis() -> dict | None:
+    """Get the most recent KPI snapshot straight from the KPI columns (no JSON decode)"""
+    latest = await _load_latest()
+    # Rows saved before the KPI columns existed only have the JSON blob
+    if latest and latest[1]["rejection_rate"] is not None:
+        return dict(latest[1])
+    return None
+
+async def get_latest_stats_raw() -> bytes | None:
+    """Get the most recent computed stats as the stored JSON bytes (SQLite only, not decoded)"""
+    latest = await _load_latest()
+    return latest[0] if latest else None
+
 async def get_latest_stats() -> dict | None:
     """Get the most recent computed stats (Prefer SQLite for speed, Fallback to Supabase if empty)"""
     
-    # Try SQLite first
-    async with aiosqlite.connect(SQLITE_DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT computed_stats FROM processed_data WHERE computed_stats IS NOT NULL ORDER BY created_at DESC LIMIT 1"
-        ) as cursor:
-            row = await cursor.fetchone()
-            if row and row["computed_stats"]:
-                return json.loads(row["computed_stats"])
+    # Try SQLite first (cached); decode per call so callers never share a dict
+    latest = await _load_latest()
+    if latest:
+        return orjson.loads(latest[0])
     
     # If SQLite empty (e.g. after restart), try Supabase
     if pg_engine:
@@ -261,11 +916,10 @@ async def get_latest_stats() -> dict | None:
 
 async def get_all_sessions(limit: int = 50) -> list[dict]:
     """Get recent upload sessions with detailed stats"""
-    async with aiosqlite.connect(SQLITE_DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with _reader() as db:
         async with db.execute(
             """
-            SELECT u.*, p.validated_data, p.raw_data 
+            SELECT u.*, p.records_valid, p.records_invalid, p.detected_file_type
             FROM upload_sessions u 
             LEFT JOIN processed_data p ON u.upload_id = p.upload_id 
             ORDER BY u.created_at DESC LIMIT ?
@@ -280,10 +934,9 @@ async def get_all_sessions(limit: int = 50) -> list[dict]:
                     # Extract filename from file_paths if available
                     file_name = None
                     file_size_bytes = 0
-                    file_type = None
                     
                     try:
-                        paths = json.loads(row["file_paths"] if "file_paths" in row.keys() else "[]")
+                        paths = orjson.loads(row["file_paths"] if "file_paths" in row.keys() else "[]")
                         if paths and len(paths) > 0:
                             p = Path(paths[0])
                             file_name = p.name
@@ -292,48 +945,21 @@ async def get_all_sessions(limit: int = 50) -> list[dict]:
                     except:
                         pass
                     
-                    # Extract validation stats
-                    records_valid = 0
-                    records_invalid = 0
-                    
-                    if row["validated_data"]:
-                        try:
-                            val_data = json.loads(row["validated_data"])
-                            records_valid = val_data.get("valid_rows", 0)
-                            records_invalid = val_data.get("error_rows", 0)
-                        except:
-                            pass
-                    
-                    # Try to detect file type from raw_data if available
-                    if row["raw_data"]:
-                         try:
-                            raw = json.loads(row["raw_data"])
-                            # Raw data keys are file types (e.g. "production_cumulative": [...])
-                            # We take the first key that is not 'unknown' if possible
-                            for k in raw.keys():
-                                if k != "unknown":
-                                    file_type = k
-                                    break
-                            if not file_type and raw.keys():
-                                file_type = list(raw.keys())[0]
-                         except:
-                            pass
-
                     results.append({
-                        "upload_id": UUID(row["upload_id"]),
-                        "status": ProcessingStatus(row["status"]),
+                        "upload_id": UUID(bytes=row["upload_id"]),
+                        "status": _STATUS_FROM_VALUE[row["status"]],
                         "progress_percent": row["progress_percent"],
                         "current_stage": row["current_stage"],
                         "files_received": row["files_received"],
                         "files_processed": row["files_processed"],
-                        "errors": json.loads(row["errors"]),
-                        "started_at": datetime.fromisoformat(row["started_at"]),
-                        "completed_at": datetime.fromisoformat(row["completed_at"]) if row["completed_at"] else None,
+                        "errors": _loads_errors(row["errors"]),
+                        "started_at": _from_ms(row["started_at"]),
+                        "completed_at": _from_ms(row["completed_at"]),
                         "file_name": file_name,
                         "file_size_bytes": file_size_bytes,
-                        "records_valid": records_valid,
-                        "records_invalid": records_invalid,
-                        "detected_file_type": file_type
+                        "records_valid": row["records_valid"] or 0,
+                        "records_invalid": row["records_invalid"] or 0,
+                        "detected_file_type": row["detected_file_type"]
                     })
                 except Exception as e:
                     # Log error but don't fail the request
@@ -343,20 +969,26 @@ async def get_all_sessions(limit: int = 50) -> list[dict]:
 
 async def reset_db():
     """Clear all data from the database (SQLite AND Postgres)"""
-    # 1. Clear SQLite
-    async with aiosqlite.connect(SQLITE_DB_PATH) as db:
-        await db.execute("DELETE FROM processed_data")
-        await db.execute("DELETE FROM upload_sessions")
-        await db.commit()
+    global _last_kpi_digest
+    # 1. Clear SQLite - one writer op = one transaction for both tables.
+    # Unqualified DELETEs hit SQLite's truncate optimization (no per-row work).
+    await _write(
+        ("DELETE FROM processed_data", ()),
+        ("DELETE FROM upload_sessions", ()),
+    )
+    _invalidate_latest_cache()
     
     # 2. Clear Postgres (Supabase)
     if pg_engine:
+        # Snapshots still buffered belong to the data being cleared
+        while _kpi_queue is not None and not _kpi_queue.empty():
+            _kpi_queue.get_nowait()
         try:
             async with pg_engine.begin() as conn:
-                await conn.execute(text("DELETE FROM analytics_kpis"))
-                # Also generic clear for other potential tables if they exist
-                # await conn.execute(text("TRUNCATE TABLE production_summary, defect_occurrence CASCADE")) 
-                # Keeping it safe with just analytics_kpis for now as that's what we explicitly insert
+                # TRUNCATE drops the heap in one step instead of writing a dead tuple per row
+                await conn.execute(text("TRUNCATE TABLE analytics_kpis"))
+            # History is empty again, so the next snapshot must be inserted even if unchanged
+            _last_kpi_digest = None
         except Exception as e:
             print(f"Failed to clear Postgres DB: {e}")
 
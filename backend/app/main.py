@@ -5,9 +5,11 @@ Main entry point for the Python backend API
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.config import settings
-from app.db.session import init_db
+from app.db import init_db, close_db
+from app.pipelines import shutdown_process_pool
 from app.routers import upload, stats
 
 
@@ -18,13 +20,15 @@ async def lifespan(app: FastAPI):
     await init_db()
     yield
     # Shutdown
-    pass
+    shutdown_process_pool()
+    await close_db()
 
 
 app = FastAPI(
     title=settings.api_title,
     version=settings.api_version,
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc"
 )
@@ -4,15 +4,56 @@ Coordinates parsing, validation, and computation pipelines
 """
 from uuid import UUID
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import asyncio
+import multiprocessing
+import os
 
+from app.config import settings
 from app.models import ProcessingStatus, FileType
-from app.db import update_session, save_processed_data
-from app.pipelines.parser import parse_multiple_files
-from app.pipelines.validator import validate_parsed_data
+from app.db import update_session, update_session_and_save, optimize_db
+from app.pipelines.parser import parse_excel_file, group_by_file_type, ParseResult
+from app.pipelines.validator import validate_parsed_data, ValidationResult
 from app.pipelines.computation import compute_statistics
 
 
+# Parsing and validation are CPU-bound Python, so they run in worker processes.
+# The pool is created on first use and shared by all uploads.
+_process_pool: ProcessPoolExecutor | None = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Shared worker-process pool for the parse/validate stage"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.pipeline_workers or os.cpu_count(),
+            # spawn: forking the server would copy its event loop and DB threads
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """Stop the worker processes (application shutdown, or after a worker crash)"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def _parse_and_validate(file_path: str) -> tuple[ParseResult, ValidationResult]:
+    """
+    Parse one file and validate it in the same worker process.
+    
+    The rules have no cross-file state, so each file validates on its own,
+    while its sheets are still in the worker's memory.
+    """
+    result = parse_excel_file(file_path)
+    return result, validate_parsed_data({result.file_type: [result]})
+
+
 async def process_files(upload_id: UUID, file_paths: list[str]):
     """
     Main processing orchestrator - runs in background task.
@@ -34,13 +75,14 @@ async def process_files(upload_id: UUID, file_paths: list[str]):
             current_stage="Parsing Excel files"
         )
         
-        # Run parsing (CPU-bound, so run in executor)
-        loop = asyncio.get_event_loop()
-        parsed_files = await loop.run_in_executor(
-            None,
-            parse_multiple_files,
-            file_paths
+        # Parse and validate files in parallel worker processes, one task per file
+        loop = asyncio.get_running_loop()
+        pool = get_process_pool()
+        file_results = await asyncio.gather(
+            *(loop.run_in_executor(pool, _parse_and_validate, path) for path in file_paths)
         )
+        parse_results = [parse_result for parse_result, _ in file_results]
+        parsed_files = group_by_file_type(parse_results)
         
         # Count parsed files
         files_parsed = sum(
@@ -48,13 +90,6 @@ async def process_files(upload_id: UUID, file_paths: list[str]):
             for results in parsed_files.values()
         )
         
-        await update_session(
-            upload_id,
-            progress_percent=40,
-            current_stage=f"Parsed {files_parsed}/{total_files} files",
-            files_processed=files_parsed
-        )
-        
         # Save raw parsed data
         raw_data = {
             file_type.value: [
@@ -75,21 +110,26 @@ async def process_files(upload_id: UUID, file_paths: list[str]):
             ]
             for file_type, results in parsed_files.items()
         }
-        await save_processed_data(upload_id, raw_data=raw_data)
         
-        # Stage 2: Validation
-        await update_session(
+        # Parse results + start of Stage 2 (Validation) are one transaction
+        await update_session_and_save(
             upload_id,
-            status=ProcessingStatus.VALIDATING,
-            progress_percent=50,
-            current_stage="Validating data consistency"
+            session_updates=dict(
+                status=ProcessingStatus.VALIDATING,
+                progress_percent=50,
+                current_stage="Validating data consistency",
+                files_processed=files_parsed
+            ),
+            processed_payload={"raw_data": raw_data}
         )
         
-        validation_result = await loop.run_in_executor(
-            None,
-            validate_parsed_data,
-            parsed_files
-        )
+        # Merge per-file results in the order validate_parsed_data(parsed_files) reports them
+        type_order = {ft: i for i, ft in enumerate(parsed_files)}
+        validation_result = ValidationResult()
+        for parse_result, file_validation in sorted(
+            file_results, key=lambda pair: type_order[pair[0].file_type]
+        ):
+            validation_result.merge(file_validation)
         
         # Check for critical errors
         if not validation_result.valid and validation_result.error_rows > validation_result.total_rows * 0.5:
@@ -104,12 +144,6 @@ async def process_files(upload_id: UUID, file_paths: list[str]):
             )
             return
         
-        await update_session(
-            upload_id,
-            progress_percent=70,
-            current_stage=f"Validated {validation_result.valid_rows}/{validation_result.total_rows} rows"
-        )
-        
         # Save validated data summary
         validated_data = {
             "valid": validation_result.valid,
@@ -139,14 +173,16 @@ async def process_files(upload_id: UUID, file_paths: list[str]):
                 for w in validation_result.warnings[:20]
             ]
         }
-        await save_processed_data(upload_id, validated_data=validated_data)
         
-        # Stage 3: Computation
-        await update_session(
+        # Validation results + start of Stage 3 (Computation) are one transaction
+        await update_session_and_save(
             upload_id,
-            status=ProcessingStatus.COMPUTING,
-            progress_percent=80,
-            current_stage="Computing statistics and trends"
+            session_updates=dict(
+                status=ProcessingStatus.COMPUTING,
+                progress_percent=80,
+                current_stage="Computing statistics and trends"
+            ),
+            processed_payload={"validated_data": validated_data}
         )
         
         stats = await loop.run_in_executor(
@@ -157,19 +193,24 @@ async def process_files(upload_id: UUID, file_paths: list[str]):
         
         # Convert stats to dict for storage
         stats_dict = stats.model_dump(mode="json")
-        await save_processed_data(upload_id, computed_stats=stats_dict)
         
-        # Stage 4: Complete
-        await update_session(
+        # Stats + Stage 4 (Complete) are one transaction
+        await update_session_and_save(
             upload_id,
-            status=ProcessingStatus.COMPLETED,
-            progress_percent=100,
-            current_stage="Processing complete",
-            files_processed=total_files,
-            completed_at=datetime.utcnow()
+            session_updates=dict(
+                status=ProcessingStatus.COMPLETED,
+                progress_percent=100,
+                current_stage="Processing complete",
+                files_processed=total_files,
+                completed_at=datetime.utcnow()
+            ),
+            processed_payload={"computed_stats": stats_dict}
         )
         
     except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            # A worker died; the pool can't be reused, the next upload gets a fresh one
+            shutdown_process_pool()
         # Handle any unexpected errors
         await update_session(
             upload_id,
@@ -179,6 +220,12 @@ async def process_files(upload_id: UUID, file_paths: list[str]):
             errors=[str(e)],
             completed_at=datetime.utcnow()
         )
+    else:
+        # The tables just grew: refresh planner statistics (the upload is already complete)
+        try:
+            await optimize_db()
+        except Exception as e:
+            print(f"PRAGMA optimize failed: {e}")
 
 
 # Re-export for convenience
@@ -198,6 +245,7 @@ from app.pipelines.computation import (
 
 __all__ = [
     "process_files",
+    "shutdown_process_pool",
     "parse_excel_file",
     "parse_multiple_files",
     "detect_file_type",
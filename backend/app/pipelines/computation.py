@@ -2,9 +2,15 @@
 RAIS Backend - Computation Pipeline
 Computes KPIs, trends, pareto charts from validated data
 """
+import calendar
+import re
+from bisect import insort
 from datetime import datetime, date
 from typing import Optional
 from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
 
 from app.models import (
     FileType,
@@ -21,7 +27,7 @@ from app.models import (
     DefectCategory,
     Severity,
 )
-from app.pipelines.parser import ParseResult, excel_serial_to_date
+from app.pipelines.parser import ParseResult, ParsedSheet, excel_serial_to_date
 
 
 # ============================================================================
@@ -38,6 +44,22 @@ def find_column_value(row: dict, patterns: list[str]) -> tuple[Optional[str], Op
     return None, None
 
 
+@lru_cache(maxsize=1024)
+def resolve_column(keys: tuple[str, ...], patterns: tuple[str, ...]) -> Optional[str]:
+    """
+    Column find_column_value would pick for rows with these keys.
+    
+    Parsed rows of a sheet share one key layout, so this runs once per sheet
+    instead of once per row.
+    """
+    for key in keys:
+        key_upper = key.upper()
+        for pattern in patterns:
+            if pattern.upper() in key_upper:
+                return key
+    return None
+
+
 def safe_numeric(value) -> float:
     """Convert to numeric, returning 0 for invalid values"""
     if value is None:
@@ -53,10 +75,60 @@ def safe_numeric(value) -> float:
     return 0
 
 
+def numeric_column(sheet: ParsedSheet, key: Optional[str]) -> list[float]:
+    """safe_numeric applied to one column of a sheet, converted in a single NumPy pass"""
+    if key is None:
+        return [0.0] * sheet.row_count
+    values = sheet.columns[key]
+    try:
+        # Numbers, numeric strings and None (as 0) convert in one C loop
+        column = np.array([0.0 if v is None else v for v in values], dtype=np.float64)
+    except (TypeError, ValueError):
+        # Thousands separators, text, dates - fall back to the per-cell rules
+        column = np.fromiter(map(safe_numeric, values), dtype=np.float64, count=len(values))
+    return np.abs(column).tolist()
+
+
+MONTH_PATTERNS = ("MONTH", "DATE", "PERIOD")
+
+
 def get_month_key(row: dict) -> Optional[str]:
     """Extract month key (YYYY-MM) from row"""
-    col, value = find_column_value(row, ["MONTH", "DATE", "PERIOD"])
-    
+    col, value = find_column_value(row, MONTH_PATTERNS)
+    return month_key_from_value(value)
+
+
+_SHEET_MONTH_RE = re.compile(r"(JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)[A-Z]*\s*(\d{2,4})")
+_MONTH_ABBR_NUMBERS = {
+    "JAN": "01", "FEB": "02", "MAR": "03", "APR": "04",
+    "MAY": "05", "JUN": "06", "JUL": "07", "AUG": "08",
+    "SEP": "09", "OCT": "10", "NOV": "11", "DEC": "12"
+}
+
+
+@lru_cache(maxsize=512)
+def sheet_month_key(sheet_name: str) -> Optional[str]:
+    """Month key (YYYY-MM) named in a sheet title such as "APRIL 25", if any"""
+    match = _SHEET_MONTH_RE.search(sheet_name.upper())
+    if not match:
+        return None
+    year = match.group(2)
+    if len(year) == 2:
+        year = "20" + year
+    return f"{year}-{_MONTH_ABBR_NUMBERS[match.group(1)]}"
+
+
+@lru_cache(maxsize=512)
+def _month_to_date(month: str, day: int = 15) -> Optional[date]:
+    """Date for a day of a month key (None if the key isn't a valid YYYY-MM)"""
+    try:
+        return datetime.strptime(f"{month}-{day:02d}", "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def month_key_from_value(value) -> Optional[str]:
+    """Month key (YYYY-MM) for a month/date cell value"""
     if value is None:
         return None
     
@@ -69,17 +141,41 @@ def get_month_key(row: dict) -> Optional[str]:
         d = value if isinstance(value, date) else value.date()
         return d.strftime("%Y-%m")
     elif isinstance(value, str):
-        # Try common formats
-        for fmt in ["%B %Y", "%b %Y", "%Y-%m", "%m/%Y"]:
-            try:
-                parsed = datetime.strptime(value.strip(), fmt)
-                return parsed.strftime("%Y-%m")
-            except ValueError:
-                continue
+        return _month_key_from_text(value)
     
     return None
 
 
+# "April 2025" / "Apr 2025" / "2025-04" / "04/2025" - the formats get_month_key accepts
+_MONTH_TEXT_RE = re.compile(
+    r"(?P<name>[A-Za-z]+)\s+(?P<y1>\d{4})"
+    r"|(?P<y2>\d{4})-(?P<m2>1[0-2]|0[1-9]|[1-9])"
+    r"|(?P<m3>1[0-2]|0[1-9]|[1-9])/(?P<y3>\d{4})"
+)
+_MONTH_NUMBERS = {
+    name.lower(): number
+    for names in (calendar.month_name, calendar.month_abbr)
+    for number, name in enumerate(names) if name
+}
+
+
+def _month_key_from_text(value: str) -> Optional[str]:
+    """Month key for a text cell, matched with one compiled pattern instead of strptime attempts"""
+    match = _MONTH_TEXT_RE.fullmatch(value.strip())
+    if not match:
+        return None
+    name, year = match["name"], match["y1"] or match["y2"] or match["y3"]
+    if name is not None:
+        month = _MONTH_NUMBERS.get(name.lower())
+        if month is None:
+            return None
+    else:
+        month = int(match["m2"] or match["m3"])
+    if int(year) < 1:
+        return None
+    return f"{year}-{month:02d}"
+
+
 # ============================================================================
 # COST CONFIGURATION
 # ============================================================================
@@ -92,28 +188,107 @@ COST_PER_REJECTED_UNIT = 365  # INR
 # ============================================================================
 
 class DataAggregator:
-    """Aggregates data from parsed files"""
+    """
+    Aggregates data from parsed files.
+    
+    Totals are stored structure-of-arrays: one float64 array per measure,
+    indexed by month (and stage / defect) through the insertion-ordered
+    *_index dicts. Arrays grow by doubling; use the *_table() / by_*()
+    accessors for views trimmed to the rows and months seen so far.
+    
+    The totals the KPI functions need (overall, per month, per stage, per
+    defect) are kept as running aggregates, updated on every add_*.
+    """
+    
+    # Arrays with a month axis / a stage axis, for growing them together
+    _MONTH_VECTORS = ("produced", "dispatched", "has_production", "has_defects", "rejected_by_month")
+    _MONTH_TABLES = ("inspected", "accepted", "rejected", "received", "defect_counts")
+    _STAGE_VECTORS = ("stage_inspected", "stage_accepted", "stage_rejected")
+    _STAGE_TABLES = ("inspected", "accepted", "rejected", "received")
     
     def __init__(self):
-        # Production data: month -> {produced, dispatched}
-        self.production: dict[str, dict[str, float]] = defaultdict(lambda: {"produced": 0, "dispatched": 0})
+        self.month_index: dict[str, int] = {}
+        self.stage_index: dict[str, int] = {}
+        self.defect_index: dict[str, int] = {}
         
-        # Stage data: stage_code -> month -> {inspected, accepted, rejected}
-        self.stages: dict[str, dict[str, dict[str, float]]] = defaultdict(
-            lambda: defaultdict(lambda: {"inspected": 0, "accepted": 0, "rejected": 0, "received": 0})
-        )
+        # Production data: [month]; has_production marks months with a production row
+        self.produced = np.zeros(16)
+        self.dispatched = np.zeros(16)
+        self.has_production = np.zeros(16, dtype=bool)
+        
+        # Stage data: [stage, month]
+        self.inspected = np.zeros((4, 16))
+        self.accepted = np.zeros((4, 16))
+        self.rejected = np.zeros((4, 16))
+        self.received = np.zeros((4, 16))
+        
+        # Defect data: [defect, month]; has_defects marks months with any defect count
+        self.defect_counts = np.zeros((32, 16))
+        self.has_defects = np.zeros(16, dtype=bool)
+        
+        # Running aggregates
+        self.total_produced = 0.0
+        self.total_dispatched = 0.0
+        self.total_rejected = 0.0
+        self.rejected_by_month = np.zeros(16)
+        self.stage_inspected = np.zeros(4)
+        self.stage_accepted = np.zeros(4)
+        self.stage_rejected = np.zeros(4)
+        self.defect_total = np.zeros(32)
         
-        # Defect data: defect_code -> month -> count
-        self.defects: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        # Months with production / defect data, kept sorted as they first appear
+        self._production_months: list[str] = []
+        self._defect_months: list[str] = []
         
         # Sources for traceability
         self.sources: list[DataSource] = []
     
+    def _month(self, month: str) -> int:
+        idx = self.month_index.get(month)
+        if idx is None:
+            idx = self.month_index[month] = len(self.month_index)
+            if idx == self.produced.shape[0]:
+                for name in self._MONTH_VECTORS:
+                    setattr(self, name, np.pad(getattr(self, name), (0, idx)))
+                for name in self._MONTH_TABLES:
+                    setattr(self, name, np.pad(getattr(self, name), ((0, 0), (0, idx))))
+        return idx
+    
+    def _stage(self, stage_code: str) -> int:
+        idx = self.stage_index.get(stage_code)
+        if idx is None:
+            idx = self.stage_index[stage_code] = len(self.stage_index)
+            if idx == self.inspected.shape[0]:
+                for name in self._STAGE_VECTORS:
+                    setattr(self, name, np.pad(getattr(self, name), (0, idx)))
+                for name in self._STAGE_TABLES:
+                    setattr(self, name, np.pad(getattr(self, name), ((0, idx), (0, 0))))
+        return idx
+    
+    def _defect(self, defect_code: str) -> int:
+        idx = self.defect_index.get(defect_code)
+        if idx is None:
+            idx = self.defect_index[defect_code] = len(self.defect_index)
+            if idx == self.defect_counts.shape[0]:
+                self.defect_counts = np.pad(self.defect_counts, ((0, idx), (0, 0)))
+                self.defect_total = np.pad(self.defect_total, (0, idx))
+        return idx
+    
     def add_production(self, month: str, produced: float, dispatched: float, source: DataSource):
-        self.production[month]["produced"] += produced
-        self.production[month]["dispatched"] += dispatched
+        m = self._month(month)
+        self.produced[m] += produced
+        self.dispatched[m] += dispatched
+        if not self.has_production[m]:
+            self.has_production[m] = True
+            insort(self._production_months, month)
+        self.total_produced += produced
+        self.total_dispatched += dispatched
         self.sources.append(source)
     
+    def add_stage(self, stage_code: str):
+        """Register a stage without recording quantities"""
+        self._stage(stage_code)
+    
     def add_stage_data(
         self,
         stage_code: str,
@@ -124,15 +299,50 @@ class DataAggregator:
         received: float,
         source: DataSource
     ):
-        self.stages[stage_code][month]["inspected"] += inspected
-        self.stages[stage_code][month]["accepted"] += accepted
-        self.stages[stage_code][month]["rejected"] += rejected
-        self.stages[stage_code][month]["received"] += received
+        s, m = self._stage(stage_code), self._month(month)
+        self.inspected[s, m] += inspected
+        self.accepted[s, m] += accepted
+        self.rejected[s, m] += rejected
+        self.received[s, m] += received
+        self.stage_inspected[s] += inspected
+        self.stage_accepted[s] += accepted
+        self.stage_rejected[s] += rejected
+        self.rejected_by_month[m] += rejected
+        self.total_rejected += rejected
         self.sources.append(source)
     
     def add_defect(self, defect_code: str, month: str, count: float, source: DataSource):
-        self.defects[defect_code][month] += count
+        d, m = self._defect(defect_code), self._month(month)
+        self.defect_counts[d, m] += count
+        self.defect_total[d] += count
+        if not self.has_defects[m]:
+            self.has_defects[m] = True
+            insort(self._defect_months, month)
         self.sources.append(source)
+    
+    def stage_table(self, measure: np.ndarray) -> np.ndarray:
+        """[stage, month] view of a stage measure trimmed to the data seen"""
+        return measure[:len(self.stage_index), :len(self.month_index)]
+    
+    def defect_table(self) -> np.ndarray:
+        """[defect, month] view of the defect counts trimmed to the data seen"""
+        return self.defect_counts[:len(self.defect_index), :len(self.month_index)]
+    
+    def by_stage(self, totals: np.ndarray) -> np.ndarray:
+        """Running per-stage totals (stage_inspected / _accepted / _rejected) trimmed to the stages seen"""
+        return totals[:len(self.stage_index)]
+    
+    def by_defect(self) -> np.ndarray:
+        """Running per-defect totals trimmed to the defects seen"""
+        return self.defect_total[:len(self.defect_index)]
+    
+    def production_months(self) -> list[str]:
+        """Months that have production data, in order"""
+        return list(self._production_months)
+    
+    def defect_months(self) -> list[str]:
+        """Months that have defect counts, in order"""
+        return list(self._defect_months)
 
 
 # ============================================================================
@@ -154,28 +364,57 @@ DEFECT_PATTERNS = [
 ]
 
 
+PRODUCED_PATTERNS = ("PRODUCTION", "PRODUCED", "PROD QTY")
+DISPATCHED_PATTERNS = ("DISPATCH", "DISPATCHED")
+RECEIVED_PATTERNS = ("RECEIVED", "REC", "INPUT")
+INSPECTED_PATTERNS = ("INSPECTED", "INSP", "CHECKED", "TOTAL")
+ACCEPTED_PATTERNS = ("ACCEPTED", "ACC", "PASSED", "OK")
+REJECTED_PATTERNS = ("REJECTED", "REJ", "FAILED", "NG")
+
+
+@lru_cache(maxsize=256)
+def defect_columns(keys: tuple[str, ...]) -> tuple[tuple[str, str], ...]:
+    """(column, defect pattern) for each defect column of a sheet, in column order"""
+    columns = []
+    for key in keys:
+        if key.startswith("_"):
+            continue
+        key_upper = key.upper()
+        # First pattern in DEFECT_PATTERNS order wins
+        pattern = next((p for p in DEFECT_PATTERNS if p in key_upper), None)
+        if pattern is not None:
+            columns.append((key, pattern))
+    return tuple(columns)
+
+
 def extract_from_production(results: list[ParseResult], aggregator: DataAggregator):
     """Extract production data from production/cumulative files"""
     for result in results:
         for sheet in result.sheets:
-            for row in sheet.data:
-                month = get_month_key(row)
+            if not sheet.row_count:
+                continue
+            # Resolve columns once per sheet
+            keys = tuple(sheet.columns)
+            month_col = resolve_column(keys, MONTH_PATTERNS)
+            month_values = sheet.columns[month_col] if month_col else [None] * sheet.row_count
+            produced_values = numeric_column(sheet, resolve_column(keys, PRODUCED_PATTERNS))
+            dispatched_values = numeric_column(sheet, resolve_column(keys, DISPATCHED_PATTERNS))
+            
+            for i, row_num in enumerate(sheet.source_rows):
+                month = month_key_from_value(month_values[i])
                 if not month:
                     continue
                 
-                _, produced = find_column_value(row, ["PRODUCTION", "PRODUCED", "PROD QTY"])
-                _, dispatched = find_column_value(row, ["DISPATCH", "DISPATCHED"])
-                
-                source = DataSource(
+                source = DataSource.model_construct(
                     file_name=sheet.file_name,
                     sheet_name=sheet.name,
-                    row_numbers=[row.get("_source_row", 0)]
+                    row_numbers=[row_num]
                 )
                 
                 aggregator.add_production(
                     month,
-                    safe_numeric(produced),
-                    safe_numeric(dispatched),
+                    produced_values[i],
+                    dispatched_values[i],
                     source
                 )
 
@@ -187,103 +426,122 @@ def extract_from_inspection(results: list[ParseResult], file_type: FileType, agg
     for result in results:
         for sheet in result.sheets:
             # Try to determine month from sheet name (e.g., "APRIL 25")
-            sheet_month = None
-            import re
-            month_match = re.search(r"(JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)[A-Z]*\s*(\d{2,4})", sheet.name.upper())
-            if month_match:
-                month_abbr = month_match.group(1)[:3]
-                year = month_match.group(2)
-                if len(year) == 2:
-                    year = "20" + year
-                month_map = {
-                    "JAN": "01", "FEB": "02", "MAR": "03", "APR": "04",
-                    "MAY": "05", "JUN": "06", "JUL": "07", "AUG": "08",
-                    "SEP": "09", "OCT": "10", "NOV": "11", "DEC": "12"
-                }
-                sheet_month = f"{year}-{month_map.get(month_abbr, '01')}"
+            sheet_month = sheet_month_key(sheet.name)
+            
+            if not sheet.row_count:
+                continue
+            # A stage with data rows is reported even if none carry quantities
+            aggregator.add_stage(stage_code)
             
-            for row in sheet.data:
-                month = get_month_key(row) or sheet_month or "2025-04"
+            keys = tuple(sheet.columns)
+            file_name, sheet_name = sheet.file_name, sheet.name
+            received_col = resolve_column(keys, RECEIVED_PATTERNS)
+            inspected_col = resolve_column(keys, INSPECTED_PATTERNS)
+            accepted_col = resolve_column(keys, ACCEPTED_PATTERNS)
+            rejected_col = resolve_column(keys, REJECTED_PATTERNS)
+            defect_keys = defect_columns(keys)
+            if not defect_keys and not any((received_col, inspected_col, accepted_col, rejected_col)):
+                continue
+            
+            month_col = resolve_column(keys, MONTH_PATTERNS)
+            month_values = sheet.columns[month_col] if month_col else [None] * sheet.row_count
+            defect_values = [(key, pattern, numeric_column(sheet, key)) for key, pattern in defect_keys]
+            received_values = numeric_column(sheet, received_col)
+            inspected_values = numeric_column(sheet, inspected_col)
+            accepted_values = numeric_column(sheet, accepted_col)
+            rejected_values = numeric_column(sheet, rejected_col)
+            
+            # Per-sheet totals: one add_* call (and DataSource) per month / defect column and month
+            stage_totals: dict[str, list] = {}
+            defect_totals: dict[tuple[str, str, str], list] = {}
+            
+            for i, row_num in enumerate(sheet.source_rows):
+                month = month_key_from_value(month_values[i]) or sheet_month or "2025-04"
+                inspected, accepted = inspected_values[i], accepted_values[i]
+                rejected, received = rejected_values[i], received_values[i]
                 
-                _, received = find_column_value(row, ["RECEIVED", "REC", "INPUT"])
-                _, inspected = find_column_value(row, ["INSPECTED", "INSP", "CHECKED", "TOTAL"])
-                _, accepted = find_column_value(row, ["ACCEPTED", "ACC", "PASSED", "OK"])
-                _, rejected = find_column_value(row, ["REJECTED", "REJ", "FAILED", "NG"])
+                # Blank / label rows: no stage quantities to record (defects may still follow)
+                if inspected or accepted or rejected or received:
+                    totals = stage_totals.get(month)
+                    if totals is None:
+                        stage_totals[month] = [inspected, accepted, rejected, received, [row_num]]
+                    else:
+                        totals[0] += inspected
+                        totals[1] += accepted
+                        totals[2] += rejected
+                        totals[3] += received
+                        totals[4].append(row_num)
                 
-                source = DataSource(
-                    file_name=sheet.file_name,
-                    sheet_name=sheet.name,
-                    row_numbers=[row.get("_source_row", 0)]
+                # Extract defect counts from columns
+                for key, pattern, values in defect_values:
+                    count = values[i]
+                    if count > 0:
+                        totals = defect_totals.get((key, pattern, month))
+                        if totals is None:
+                            defect_totals[(key, pattern, month)] = [count, [row_num]]
+                        else:
+                            totals[0] += count
+                            totals[1].append(row_num)
+            
+            for month, (inspected, accepted, rejected, received, row_numbers) in stage_totals.items():
+                source = DataSource.model_construct(
+                    file_name=file_name,
+                    sheet_name=sheet_name,
+                    row_numbers=row_numbers
                 )
-                
                 aggregator.add_stage_data(
-                    stage_code,
-                    month,
-                    safe_numeric(inspected),
-                    safe_numeric(accepted),
-                    safe_numeric(rejected),
-                    safe_numeric(received),
-                    source
+                    stage_code, month, inspected, accepted, rejected, received, source
                 )
-                
-                # Extract defect counts from columns
-                for key, value in row.items():
-                    if key.startswith("_"):
-                        continue
-                    
-                    # Check if column is a defect type
-                    for pattern in DEFECT_PATTERNS:
-                        if pattern in key.upper():
-                            count = safe_numeric(value)
-                            if count > 0:
-                                defect_source = DataSource(
-                                    file_name=sheet.file_name,
-                                    sheet_name=sheet.name,
-                                    row_numbers=[row.get("_source_row", 0)],
-                                    column_name=key
-                                )
-                                aggregator.add_defect(pattern, month, count, defect_source)
-                            break
+            
+            for (key, pattern, month), (count, row_numbers) in defect_totals.items():
+                defect_source = DataSource.model_construct(
+                    file_name=file_name,
+                    sheet_name=sheet_name,
+                    row_numbers=row_numbers,
+                    column_name=key
+                )
+                aggregator.add_defect(pattern, month, count, defect_source)
 
 
 # ============================================================================
 # KPI COMPUTATION
 # ============================================================================
 
-def compute_kpis(aggregator: DataAggregator) -> KPIData:
+# The per-row / per-point models below are built from values this module already
+# typed (floats, ints, dates), so they skip validation via model_construct.
+# Keep every numeric field a float/int of the declared type - nothing coerces it.
+
+def monthly_rejections(aggregator: DataAggregator) -> np.ndarray:
+    """Rejections over all stages per month index - shared by the KPI and trend computations"""
+    return aggregator.rejected_by_month[:len(aggregator.month_index)]
+
+
+def compute_kpis(aggregator: DataAggregator, rejected_by_month: Optional[np.ndarray] = None) -> KPIData:
     """Compute overall KPIs from aggregated data"""
-    total_produced = sum(p["produced"] for p in aggregator.production.values())
-    total_dispatched = sum(p["dispatched"] for p in aggregator.production.values())
-    
-    # Total rejected from all stages
-    total_rejected = sum(
-        stage_data["rejected"]
-        for stage_months in aggregator.stages.values()
-        for stage_data in stage_months.values()
-    )
+    total_produced = aggregator.total_produced
+    total_dispatched = aggregator.total_dispatched
+    
+    # Total rejected from all stages (current/previous month read from the running per-month totals)
+    if rejected_by_month is None:
+        rejected_by_month = monthly_rejections(aggregator)
+    total_rejected = aggregator.total_rejected
     
     # Rejection rate
     rejection_rate = (total_rejected / total_produced * 100) if total_produced > 0 else 0
     yield_rate = 100 - rejection_rate
     
     # Get latest month for comparison
-    all_months = sorted(aggregator.production.keys())
+    all_months = aggregator.production_months()
     if len(all_months) >= 2:
-        current_month = all_months[-1]
-        prev_month = all_months[-2]
+        current = aggregator.month_index[all_months[-1]]
+        prev = aggregator.month_index[all_months[-2]]
         
-        current_prod = aggregator.production[current_month]["produced"]
-        current_rej = sum(
-            stage_months.get(current_month, {}).get("rejected", 0)
-            for stage_months in aggregator.stages.values()
-        )
+        current_prod = float(aggregator.produced[current])
+        current_rej = float(rejected_by_month[current])
         current_rate = (current_rej / current_prod * 100) if current_prod > 0 else 0
         
-        prev_prod = aggregator.production[prev_month]["produced"]
-        prev_rej = sum(
-            stage_months.get(prev_month, {}).get("rejected", 0)
-            for stage_months in aggregator.stages.values()
-        )
+        prev_prod = float(aggregator.produced[prev])
+        prev_rej = float(rejected_by_month[prev])
         prev_rate = (prev_rej / prev_prod * 100) if prev_prod > 0 else 0
         
         rate_change = current_rate - prev_rate
@@ -296,19 +554,14 @@ def compute_kpis(aggregator: DataAggregator) -> KPIData:
     financial_impact = total_rejected * COST_PER_REJECTED_UNIT
     
     # Production date (latest)
-    prod_date = date.today()
-    if all_months:
-        try:
-            prod_date = datetime.strptime(all_months[-1] + "-01", "%Y-%m-%d").date()
-        except ValueError:
-            pass
+    prod_date = (_month_to_date(all_months[-1], 1) if all_months else None) or date.today()
     
     # Watch batches (simplified: stages with >10% rejection)
-    watch_count = sum(
-        1 for stage_months in aggregator.stages.values()
-        for month_data in stage_months.values()
-        if month_data["inspected"] > 0 and (month_data["rejected"] / month_data["inspected"] * 100) > 10
-    )
+    rejected = aggregator.stage_table(aggregator.rejected)
+    inspected = aggregator.stage_table(aggregator.inspected)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stage_rates = rejected / inspected * 100
+    watch_count = int(np.count_nonzero((inspected > 0) & (stage_rates > 10)))
     
     return KPIData(
         rejection_rate=round(rejection_rate, 2),
@@ -336,21 +589,21 @@ def compute_stage_kpis(aggregator: DataAggregator) -> list[StageKPI]:
         "INTEGRITY": "Balloon & Valve Integrity",
     }
     
-    total_rejected = sum(
-        data["rejected"]
-        for months in aggregator.stages.values()
-        for data in months.values()
-    )
+    # Per-stage totals across months
+    inspected_totals = aggregator.by_stage(aggregator.stage_inspected).tolist()
+    accepted_totals = aggregator.by_stage(aggregator.stage_accepted).tolist()
+    rejected_totals = aggregator.by_stage(aggregator.stage_rejected).tolist()
+    total_rejected = aggregator.total_rejected
     
-    for stage_code, months_data in aggregator.stages.items():
-        inspected = sum(d["inspected"] for d in months_data.values())
-        accepted = sum(d["accepted"] for d in months_data.values())
-        rejected = sum(d["rejected"] for d in months_data.values())
+    for stage_code, idx in aggregator.stage_index.items():
+        inspected = inspected_totals[idx]
+        accepted = accepted_totals[idx]
+        rejected = rejected_totals[idx]
         
-        rejection_rate = (rejected / inspected * 100) if inspected > 0 else 0
-        contribution = (rejected / total_rejected * 100) if total_rejected > 0 else 0
+        rejection_rate = (rejected / inspected * 100) if inspected > 0 else 0.0
+        contribution = (rejected / total_rejected * 100) if total_rejected > 0 else 0.0
         
-        stage_kpis.append(StageKPI(
+        stage_kpis.append(StageKPI.model_construct(
             stage_code=stage_code,
             stage_name=stage_names.get(stage_code, stage_code),
             inspected=int(inspected),
@@ -366,25 +619,23 @@ def compute_stage_kpis(aggregator: DataAggregator) -> list[StageKPI]:
     return stage_kpis
 
 
-def compute_rejection_trend(aggregator: DataAggregator) -> TrendChart:
+def compute_rejection_trend(aggregator: DataAggregator, rejected_by_month: Optional[np.ndarray] = None) -> TrendChart:
     """Compute rejection rate trend over months"""
-    months = sorted(aggregator.production.keys())
+    months = aggregator.production_months()
+    if rejected_by_month is None:
+        rejected_by_month = monthly_rejections(aggregator)
+    rejected_by_month = rejected_by_month.tolist()
     
     series_data = []
     for month in months:
-        produced = aggregator.production[month]["produced"]
-        rejected = sum(
-            months_data.get(month, {}).get("rejected", 0)
-            for months_data in aggregator.stages.values()
-        )
-        rate = (rejected / produced * 100) if produced > 0 else 0
+        idx = aggregator.month_index[month]
+        produced = float(aggregator.produced[idx])
+        rejected = rejected_by_month[idx]
+        rate = (rejected / produced * 100) if produced > 0 else 0.0
         
-        try:
-            d = datetime.strptime(month + "-15", "%Y-%m-%d").date()
-        except ValueError:
-            d = date.today()
+        d = _month_to_date(month) or date.today()
         
-        series_data.append(TrendDataPoint(
+        series_data.append(TrendDataPoint.model_construct(
             date=d,
             value=round(rate, 2),
             label=month
@@ -401,36 +652,33 @@ def compute_rejection_trend(aggregator: DataAggregator) -> TrendChart:
 def compute_defect_pareto(aggregator: DataAggregator) -> ParetoChart:
     """Compute defect pareto chart (80/20 analysis)"""
     # Aggregate defects across all months
-    defect_totals = {}
-    for defect_code, months in aggregator.defects.items():
-        defect_totals[defect_code] = sum(months.values())
-    
-    # Sort by count descending
-    sorted_defects = sorted(defect_totals.items(), key=lambda x: x[1], reverse=True)
-    
-    total = sum(defect_totals.values())
-    cumulative = 0
-    threshold_80 = 0
-    
-    defect_data = []
-    for idx, (code, count) in enumerate(sorted_defects):
-        percentage = (count / total * 100) if total > 0 else 0
-        cumulative += percentage
-        
-        if cumulative <= 80 and threshold_80 == 0:
-            threshold_80 = idx
-        elif cumulative > 80 and threshold_80 == 0:
-            threshold_80 = idx
-        
-        defect_data.append(DefectData(
-            defect_code=code,
-            defect_name=code.replace("_", " ").title(),
+    codes = list(aggregator.defect_index)
+    totals = aggregator.by_defect()
+    
+    # Sort by count descending (stable: ties keep first-seen order)
+    order = np.argsort(-totals, kind="stable")
+    counts = totals[order]
+    
+    total = counts.sum()
+    percentages = counts / total * 100 if total > 0 else np.zeros_like(counts)
+    cumulative = np.cumsum(percentages)
+    # Index of the defect at which the cumulative share reaches 80%
+    threshold_80 = min(int(np.searchsorted(cumulative, 80.0)), max(len(codes) - 1, 0))
+    
+    defect_data = [
+        DefectData.model_construct(
+            defect_code=codes[i],
+            defect_name=codes[i].replace("_", " ").title(),
             category=DefectCategory.OTHER,  # Simplified
             severity=Severity.MINOR,
             count=int(count),
             percentage=round(percentage, 2),
-            cumulative_percentage=round(cumulative, 2)
-        ))
+            cumulative_percentage=round(running, 2)
+        )
+        for i, count, percentage, running in zip(
+            order.tolist(), counts.tolist(), percentages.tolist(), cumulative.tolist()
+        )
+    ]
     
     return ParetoChart(
         title="Defect Pareto Analysis (Top 80%)",
@@ -444,28 +692,27 @@ def compute_visual_defect_trends(aggregator: DataAggregator) -> list[DefectTrend
     trends = []
     
     # Focus on top defects
-    defect_totals = {code: sum(months.values()) for code, months in aggregator.defects.items()}
+    table = aggregator.defect_table()
+    defect_totals = dict(zip(aggregator.defect_index, aggregator.by_defect().tolist()))
     top_defects = sorted(defect_totals.items(), key=lambda x: x[1], reverse=True)[:5]
     
-    all_months = sorted(set(
-        month for months in aggregator.defects.values() for month in months
-    ))
+    all_months = aggregator.defect_months()
+    dates = [_month_to_date(month) or date.today() for month in all_months]
+    # [defect, month] counts for the months in order, gathered once
+    month_table = table[:, [aggregator.month_index[month] for month in all_months]]
+    half = len(all_months) // 2
     
     for defect_code, _ in top_defects:
-        monthly_data = []
-        for month in all_months:
-            count = aggregator.defects[defect_code].get(month, 0)
-            try:
-                d = datetime.strptime(month + "-15", "%Y-%m-%d").date()
-            except ValueError:
-                d = date.today()
-            
-            monthly_data.append(TrendDataPoint(date=d, value=count, label=month))
+        values = month_table[aggregator.defect_index[defect_code]]
+        monthly_data = [
+            TrendDataPoint.model_construct(date=d, value=count, label=month)
+            for month, d, count in zip(all_months, dates, values.tolist())
+        ]
         
         # Calculate trend direction
         if len(monthly_data) >= 2:
-            first_half = sum(p.value for p in monthly_data[:len(monthly_data)//2])
-            second_half = sum(p.value for p in monthly_data[len(monthly_data)//2:])
+            first_half = values[:half].sum()
+            second_half = values[half:].sum()
             if second_half > first_half * 1.1:
                 direction = "increasing"
             elif second_half < first_half * 0.9:
@@ -475,7 +722,7 @@ def compute_visual_defect_trends(aggregator: DataAggregator) -> list[DefectTrend
         else:
             direction = "stable"
         
-        avg_rate = sum(p.value for p in monthly_data) / len(monthly_data) if monthly_data else 0
+        avg_rate = float(values.mean()) if monthly_data else 0
         
         trends.append(DefectTrend(
             defect_code=defect_code,
@@ -492,21 +739,6 @@ def compute_visual_defect_trends(aggregator: DataAggregator) -> list[DefectTrend
 # MAIN COMPUTATION
 # ============================================================================
 
-def compute_statistics(parsed_files: dict[FileType, list[ParseResult]]) -> StatsResponse:
-    """
-    Main computation function - generates all statistics from parsed data.
-    """
-    aggregator = DataAggregator()
-    
-    # Extract data from each file type
-    for file_type in [FileType.PRODUCTION_CUMULATIVE, FileType.CUMULATIVE]:
-        if file_type in parsed_files:
-            extract_from_production(parsed_files[file_type], aggregator)
-    
-    for file_type in [FileType.SHOPFLOOR, FileType.ASSEMBLY, FileType.VISUAL, FileType.INTEGRITY]:
-        if file_type in parsed_files:
-            extract_from_inspection(parsed_files[file_type], file_type, aggregator)
-    
 def generate_business_summary(kpis: KPIData, stage_kpis: list[StageKPI], defect_pareto: ParetoChart) -> str:
     """Generate a narrative summary for the GM"""
     rejection_pct = kpis.rejection_rate
@@ -548,9 +780,10 @@ def compute_statistics(parsed_files: dict[FileType, list[ParseResult]]) -> Stats
             extract_from_inspection(parsed_files[file_type], file_type, aggregator)
     
     # Compute all statistics
-    kpis = compute_kpis(aggregator)
+    rejected_by_month = monthly_rejections(aggregator)
+    kpis = compute_kpis(aggregator, rejected_by_month)
     stage_kpis = compute_stage_kpis(aggregator)
-    rejection_trend = compute_rejection_trend(aggregator)
+    rejection_trend = compute_rejection_trend(aggregator, rejected_by_month)
     defect_pareto = compute_defect_pareto(aggregator)
     visual_trends = compute_visual_defect_trends(aggregator)
     
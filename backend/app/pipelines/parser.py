@@ -5,11 +5,18 @@ Handles parsing of all 6 Excel file types with proper error handling
 from pathlib import Path
 from typing import Optional
 from datetime import datetime, date
+from functools import lru_cache
+from itertools import chain, islice
+import os
+import posixpath
 import re
+import zipfile
+from xml.etree import ElementTree
 
 import pandas as pd
 from openpyxl import load_workbook
-from openpyxl.utils import get_column_letter
+from openpyxl.utils import get_column_letter, range_boundaries
+from python_calamine import CalamineError, CalamineWorkbook, SheetTypeEnum
 
 from app.models import FileType, DataSource
 
@@ -42,14 +49,22 @@ FILE_TYPE_PATTERNS = {
 }
 
 
+# All patterns in one regex, matched from the start of the name. Alternation
+# tries each group in order (with a lazy (?s:.*?) prefix, like search()), so
+# the first file type listed above still wins when several would match.
+_FILE_TYPE_GROUPS = {f"t{i}": file_type for i, file_type in enumerate(FILE_TYPE_PATTERNS)}
+_FILE_TYPE_RE = re.compile("|".join(
+    f"(?P<{group}>(?s:.*?)(?:{'|'.join(FILE_TYPE_PATTERNS[file_type])}))"
+    for group, file_type in _FILE_TYPE_GROUPS.items()
+))
+
+
+@lru_cache(maxsize=256)
 def detect_file_type(filename: str) -> FileType:
     """Detect file type from filename"""
-    name_lower = filename.lower()
-    
-    for file_type, patterns in FILE_TYPE_PATTERNS.items():
-        for pattern in patterns:
-            if re.search(pattern, name_lower):
-                return file_type
+    match = _FILE_TYPE_RE.match(filename.lower())
+    if match:
+        return _FILE_TYPE_GROUPS[match.lastgroup]
     
     return FileType.UNKNOWN
 
@@ -90,24 +105,167 @@ def excel_serial_to_date(serial: int | float) -> date | None:
 # MERGED CELL HANDLING
 # ============================================================================
 
-def unmerge_and_fill(workbook) -> None:
-    """Unmerge all cells and fill with top-left value"""
-    for sheet in workbook.worksheets:
-        # Get list of merged ranges (copy to avoid modification during iteration)
-        merged_ranges = list(sheet.merged_cells.ranges)
+# Merge refs in the worksheet XML (<mergeCells> follows <sheetData>)
+_MERGE_CELL_RE = re.compile(rb'<(?:\w+:)?mergeCell\b[^>]*?\bref="([A-Z]+[0-9]+:[A-Z]+[0-9]+)"')
+
+
+def _local_name(name: str) -> str:
+    """Tag/attribute name without its XML namespace"""
+    return name.rpartition("}")[2]
+
+
+def _part_rels(archive: zipfile.ZipFile, part: str) -> dict[str, tuple[str, str]]:
+    """Relationship Id -> (type, target part path) for a package part ("" for the package)"""
+    folder, name = posixpath.split(part)
+    rels = ElementTree.fromstring(archive.read(posixpath.join(folder, "_rels", f"{name}.rels")))
+    targets = {}
+    for rel in rels:
+        target = rel.get("Target", "")
+        path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(folder, target))
+        targets[rel.get("Id")] = (rel.get("Type", ""), path)
+    return targets
+
+
+def xlsx_merged_ranges(file_path: str) -> dict[str, list[tuple[int, int, int, int]]]:
+    """
+    Sheet title -> (min_row, min_col, max_row, max_col) of each merged range,
+    read from the workbook's raw XML parts (openpyxl's read-only mode skips them).
+    """
+    ranges = {}
+    with zipfile.ZipFile(file_path) as archive:
+        workbook_part = next(
+            path for rel_type, path in _part_rels(archive, "").values()
+            if rel_type.endswith("/officeDocument")
+        )
+        sheet_parts = _part_rels(archive, workbook_part)
+        workbook = ElementTree.fromstring(archive.read(workbook_part))
         
-        for merged_range in merged_ranges:
-            # Get top-left cell value
-            top_left = sheet.cell(merged_range.min_row, merged_range.min_col)
-            value = top_left.value
-            
-            # Unmerge
-            sheet.unmerge_cells(str(merged_range))
+        for sheet in workbook.iter():
+            if _local_name(sheet.tag) != "sheet":
+                continue
+            rel_id = next((v for k, v in sheet.attrib.items() if _local_name(k) == "id"), None)
+            if rel_id not in sheet_parts:
+                continue
             
-            # Fill all cells with the value
-            for row in range(merged_range.min_row, merged_range.max_row + 1):
-                for col in range(merged_range.min_col, merged_range.max_col + 1):
-                    sheet.cell(row, col, value)
+            sheet_ranges = []
+            for ref in _MERGE_CELL_RE.findall(archive.read(sheet_parts[rel_id][1])):
+                min_col, min_row, max_col, max_row = range_boundaries(ref.decode())
+                sheet_ranges.append((min_row, min_col, max_row, max_col))
+            ranges[sheet.get("name")] = sheet_ranges
+    return ranges
+
+
+def merged_fill(sheet) -> dict[int, list[tuple[int, int, object]]]:
+    """
+    Per row: (first_col, last_col, value) spans that repeat a merged range's
+    top-left value - what unmerging and filling the range would write.
+    """
+    ranges = sheet.merged_ranges
+    if not ranges:
+        return {}
+    
+    # Read only the rows/cols holding top-left cells
+    first_row = min(r[0] for r in ranges)
+    top_left_rows = sheet.iter_rows(
+        min_row=first_row,
+        max_row=max(r[0] for r in ranges),
+        max_col=max(r[1] for r in ranges),
+        values_only=True
+    )
+    top_left = dict(enumerate(top_left_rows, start=first_row))
+    
+    fill: dict[int, list[tuple[int, int, object]]] = {}
+    for min_row, min_col, max_row, max_col in ranges:
+        row_values = top_left.get(min_row, ())
+        value = row_values[min_col - 1] if min_col <= len(row_values) else None
+        if value is None:
+            continue
+        for row in range(min_row, max_row + 1):
+            fill.setdefault(row, []).append((min_col, max_col, value))
+    return fill
+
+
+def _calamine_value(value):
+    """Map a calamine cell value to what openpyxl's reader returns for the same cell"""
+    value_type = type(value)
+    if value_type is float:
+        # Numbers are all f64 in calamine; openpyxl reads whole numbers as int
+        if value.is_integer() and -1e15 < value < 1e15:
+            return int(value)
+        return value
+    if value_type is str:
+        return value or None  # empty cells come back as ""
+    if value_type is date:
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+class CalamineSheet:
+    """
+    A python-calamine sheet behind the read-only worksheet calls parse_sheet
+    makes (title, max_row, max_column, iter_rows), with openpyxl's value types.
+    """
+    __slots__ = ("title", "max_row", "max_column", "merged_ranges", "_rows")
+    
+    def __init__(self, sheet):
+        self.title = sheet.name
+        self._rows = [
+            [_calamine_value(value) for value in row]
+            for row in sheet.to_python(skip_empty_area=False)
+        ]
+        self.max_row = len(self._rows)
+        self.max_column = len(self._rows[0]) if self._rows else 0
+        self.merged_ranges = [
+            (min_row + 1, min_col + 1, max_row + 1, max_col + 1)
+            for (min_row, min_col), (max_row, max_col) in sheet.merged_cell_ranges or ()
+        ]
+    
+    def iter_rows(self, min_row: int = 1, max_row: int | None = None, max_col: int | None = None, values_only: bool = True):
+        for row in self._rows[min_row - 1:max_row]:
+            yield tuple(row[:max_col])
+
+
+class OpenpyxlSheet:
+    """
+    An openpyxl read-only worksheet with its size and merged ranges, behind
+    the same calls parse_sheet makes on a CalamineSheet.
+    """
+    __slots__ = ("title", "max_row", "max_column", "merged_ranges", "_sheet")
+    
+    def __init__(self, sheet, merged_ranges: list[tuple[int, int, int, int]]):
+        self._sheet = sheet
+        self.title = sheet.title
+        self.merged_ranges = merged_ranges
+        
+        # Read-only sheets are sized from their <dimension> tag; measure sheets saved without one
+        max_row, max_col = sheet.max_row, sheet.max_column
+        if max_row is None or max_col is None:
+            sheet.reset_dimensions()
+            max_row = max_col = 0
+            for max_row, row_values in enumerate(sheet.iter_rows(values_only=True), start=1):
+                max_col = max(max_col, len(row_values))
+        self.max_row, self.max_column = max_row, max_col
+    
+    def iter_rows(self, min_row: int = 1, max_row: int | None = None, max_col: int | None = None, values_only: bool = True):
+        return self._sheet.iter_rows(min_row=min_row, max_row=max_row, max_col=max_col, values_only=True)
+
+
+def iter_sheet_rows(sheet, fill: dict | None = None, min_row: int = 1, max_row: int | None = None):
+    """Value tuples for rows min_row..max_row, merged ranges filled with their top-left value"""
+    rows = sheet.iter_rows(min_row=min_row, max_row=max_row, max_col=sheet.max_column, values_only=True)
+    if not fill:
+        yield from rows
+        return
+    
+    for row_idx, row_values in enumerate(rows, start=min_row):
+        spans = fill.get(row_idx)
+        if spans:
+            row_values = list(row_values)
+            for first_col, last_col, value in spans:
+                width = min(last_col, len(row_values)) - first_col + 1
+                if width > 0:
+                    row_values[first_col - 1:first_col - 1 + width] = [value] * width
+        yield row_values
 
 
 # ============================================================================
@@ -121,6 +279,9 @@ HEADER_KEYWORDS = {
     "batch", "lot", "item", "product", "code", "remarks", "result"
 }
 
+# One alternation over all keywords - a single scan per cell
+_HEADER_RE = re.compile("|".join(re.escape(k) for k in sorted(HEADER_KEYWORDS)))
+
 
 def score_row_as_header(row: list) -> float:
     """Score a row to determine if it's a header row"""
@@ -130,24 +291,31 @@ def score_row_as_header(row: list) -> float:
     score = 0
     non_empty = 0
     
+    search = _HEADER_RE.search
     for cell in row:
-        if cell is None or (isinstance(cell, str) and not cell.strip()):
+        if cell is None:
             continue
+        cell_type = type(cell)
         
-        non_empty += 1
-        cell_str = str(cell).lower().strip()
+        # Numbers are data, and their text never contains a header keyword
+        if cell_type is int or cell_type is float:
+            non_empty += 1
+            score -= 1  # Penalize numeric values in headers
+            continue
         
-        # Check for header keywords
-        for keyword in HEADER_KEYWORDS:
-            if keyword in cell_str:
-                score += 10
-                break
+        if cell_type is str or isinstance(cell, str):
+            if not cell.strip():
+                continue
+            non_empty += 1
+            # Prefer strings over numbers for headers
+            score += 12 if search(cell.lower()) else 2
+            continue
         
-        # Prefer strings over numbers for headers
-        if isinstance(cell, str):
-            score += 2
-        elif isinstance(cell, (int, float)):
-            score -= 1  # Penalize numeric values in headers
+        non_empty += 1
+        if search(str(cell).lower()):
+            score += 10
+        if isinstance(cell, (int, float)):
+            score -= 1
     
     # Normalize by non-empty cells
     if non_empty > 0:
@@ -156,14 +324,14 @@ def score_row_as_header(row: list) -> float:
     return score
 
 
-def find_header_row(sheet, max_rows: int = 20) -> int:
+def find_header_row(sheet, max_rows: int = 20, fill: dict | None = None) -> int:
     """Find the most likely header row in a sheet"""
     best_score = 0
     best_row = 0
     
-    for row_idx in range(1, min(max_rows + 1, sheet.max_row + 1)):
-        row_values = [sheet.cell(row_idx, col).value for col in range(1, sheet.max_column + 1)]
-        score = score_row_as_header(row_values)
+    rows = iter_sheet_rows(sheet, fill, max_row=min(max_rows, sheet.max_row))
+    for row_idx, row_values in enumerate(rows, start=1):
+        score = score_row_as_header(list(row_values))
         
         if score > best_score:
             best_score = score
@@ -177,25 +345,43 @@ def find_header_row(sheet, max_rows: int = 20) -> int:
 # ============================================================================
 
 class ParsedSheet:
-    """Represents a parsed sheet"""
+    """
+    Represents a parsed sheet.
+    
+    Data is stored column-wise: columns maps each header to its values, one
+    per data row, and source_rows holds the Excel row number of each row.
+    rows() rebuilds per-row dicts for code that wants them.
+    """
+    __slots__ = ("name", "headers", "columns", "source_rows", "header_row", "file_name", "row_count")
+    
     def __init__(
         self,
         name: str,
         headers: list[str],
-        data: list[dict],
+        columns: dict[str, list],
+        source_rows: list[int],
         header_row: int,
         file_name: str
     ):
         self.name = name
         self.headers = headers
-        self.data = data
+        self.columns = columns
+        self.source_rows = source_rows
         self.header_row = header_row
         self.file_name = file_name
-        self.row_count = len(data)
+        self.row_count = len(source_rows)
+    
+    def rows(self):
+        """Row dicts (header -> value, plus "_source_row"), built on demand"""
+        keys = (*self.columns, "_source_row")
+        for values in zip(*self.columns.values(), self.source_rows):
+            yield dict(zip(keys, values))
 
 
 class ParseResult:
     """Result of parsing an Excel file"""
+    __slots__ = ("file_path", "file_name", "file_type", "sheets", "errors", "success")
+    
     def __init__(self, file_path: str):
         self.file_path = file_path
         self.file_name = Path(file_path).name
@@ -205,6 +391,10 @@ class ParseResult:
         self.success = False
 
 
+# Error values Excel caches for failed formulas
+_EXCEL_ERRORS = frozenset({"#DIV/0!", "#N/A", "#VALUE!", "#REF!", "#NAME?", "#NULL!", "#NUM!"})
+
+
 def clean_value(value):
     """Clean a cell value, handling special cases"""
     if value is None:
@@ -213,7 +403,7 @@ def clean_value(value):
     # Handle error values
     if isinstance(value, str):
         stripped = value.strip()
-        if stripped in ["#DIV/0!", "#N/A", "#VALUE!", "#REF!", "#NAME?"]:
+        if stripped in _EXCEL_ERRORS:
             return None
         if stripped == "":
             return None
@@ -221,7 +411,7 @@ def clean_value(value):
     
     # Handle negative numbers (take absolute value with flag)
     if isinstance(value, (int, float)):
-        if pd.isna(value):
+        if value != value:  # NaN
             return None
         # Keep negative for now, validator will handle
         return value
@@ -230,55 +420,50 @@ def clean_value(value):
 
 
 def parse_sheet(sheet, file_name: str) -> ParsedSheet | None:
-    """Parse a single sheet into structured data"""
+    """Parse a single (read-only) sheet into structured data"""
     if sheet.max_row < 2:
         return None
     
+    fill = merged_fill(sheet)
+    
     # Find header row
-    header_row_idx = find_header_row(sheet)
+    header_row_idx = find_header_row(sheet, fill=fill)
     if header_row_idx == 0:
         header_row_idx = 1
     
+    # Stream value tuples from the header row down (no Cell objects)
+    rows = iter_sheet_rows(sheet, fill, min_row=header_row_idx)
+    
     # Extract headers
     headers = []
-    for col in range(1, sheet.max_column + 1):
-        value = sheet.cell(header_row_idx, col).value
+    for col, value in enumerate(next(rows, ()), 1):
         if value:
             headers.append(str(value).strip().upper().replace("\n", " "))
         else:
             headers.append(f"COL_{col}")
     
-    # Remove duplicate empty columns at the end
+    # Remove duplicate empty columns at the end (probe the first data rows)
+    probe = list(islice(rows, 9))
     while headers and headers[-1].startswith("COL_"):
         # Check if the column has any data
-        has_data = False
-        col_idx = len(headers)
-        for row_idx in range(header_row_idx + 1, min(header_row_idx + 10, sheet.max_row + 1)):
-            if sheet.cell(row_idx, col_idx).value is not None:
-                has_data = True
-                break
-        if not has_data:
+        col_idx = len(headers) - 1
+        if not any(row_values[col_idx] is not None for row_values in probe):
             headers.pop()
         else:
             break
     
     # Extract data rows
     data = []
+    source_rows = []
     empty_row_count = 0
+    width = len(headers)
     
-    for row_idx in range(header_row_idx + 1, sheet.max_row + 1):
-        row_data = {}
-        has_value = False
-        
-        for col_idx, header in enumerate(headers, 1):
-            value = clean_value(sheet.cell(row_idx, col_idx).value)
-            row_data[header] = value
-            if value is not None:
-                has_value = True
+    for row_idx, row_values in enumerate(chain(probe, rows), start=header_row_idx + 1):
+        values = [clean_value(value) for value in row_values[:width]]
         
-        if has_value:
-            row_data["_source_row"] = row_idx
-            data.append(row_data)
+        if any(value is not None for value in values):
+            data.append(values)
+            source_rows.append(row_idx)
             empty_row_count = 0
         else:
             empty_row_count += 1
@@ -289,10 +474,16 @@ def parse_sheet(sheet, file_name: str) -> ParsedSheet | None:
     if not data:
         return None
     
+    # Transpose to columns; a repeated header keeps its last column, as a row dict would
+    columns = {}
+    for header, values in zip(headers, zip(*data)):
+        columns[header] = list(values)
+    
     return ParsedSheet(
         name=sheet.title,
         headers=headers,
-        data=data,
+        columns=columns,
+        source_rows=source_rows,
         header_row=header_row_idx,
         file_name=file_name
     )
@@ -306,42 +497,85 @@ def parse_excel_file(file_path: str) -> ParseResult:
     result = ParseResult(file_path)
     
     try:
-        # Load workbook with data_only to evaluate formulas
-        wb = load_workbook(file_path, data_only=True)
-        
-        # Unmerge and fill cells
-        unmerge_and_fill(wb)
-        
-        # Parse each sheet
-        for sheet in wb.worksheets:
-            # Skip sheets with specific patterns (often summary/chart sheets)
-            sheet_name_lower = sheet.title.lower()
-            if any(skip in sheet_name_lower for skip in ["chart", "graph", "summary"]):
-                continue
-            
-            parsed = parse_sheet(sheet, result.file_name)
-            if parsed:
-                result.sheets.append(parsed)
+        try:
+            sheets = _parse_with_calamine(file_path, result.file_name)
+        except CalamineError:
+            # Workbooks calamine can't read get a second chance with openpyxl
+            sheets = _parse_with_openpyxl(file_path, result.file_name)
+        result.sheets.extend(sheets)
         
         if result.sheets:
             result.success = True
         else:
             result.errors.append("No valid data sheets found")
         
-        wb.close()
-        
     except Exception as e:
         result.errors.append(f"Failed to parse file: {str(e)}")
     
     return result
 
 
+def _skip_sheet(title: str) -> bool:
+    """Skip sheets with specific patterns (often summary/chart sheets)"""
+    title_lower = title.lower()
+    return any(skip in title_lower for skip in ["chart", "graph", "summary"])
+
+
+def _parse_with_calamine(file_path: str, file_name: str) -> list[ParsedSheet]:
+    """Parse the worksheets with python-calamine (Rust); raises CalamineError on files it can't read"""
+    wb = CalamineWorkbook.from_path(file_path)
+    try:
+        sheets = []
+        for metadata in wb.sheets_metadata:
+            if metadata.typ != SheetTypeEnum.WorkSheet or _skip_sheet(metadata.name):
+                continue
+            parsed = parse_sheet(CalamineSheet(wb.get_sheet_by_name(metadata.name)), file_name)
+            if parsed:
+                sheets.append(parsed)
+        return sheets
+    finally:
+        wb.close()
+
+
+def _parse_with_openpyxl(file_path: str, file_name: str) -> list[ParsedSheet]:
+    """Fallback parse with openpyxl, for workbooks calamine rejects"""
+    sheets = []
+    
+    # Stream the workbook read-only, with data_only to evaluate formulas;
+    # merged cells are filled from the sheet's merge refs while reading
+    wb = load_workbook(file_path, data_only=True, read_only=True)
+    
+    # Read-only workbooks hold the file open until closed
+    try:
+        merges = xlsx_merged_ranges(file_path)
+        for sheet in wb.worksheets:
+            if _skip_sheet(sheet.title):
+                continue
+            
+            parsed = parse_sheet(OpenpyxlSheet(sheet, merges.get(sheet.title, [])), file_name)
+            if parsed:
+                sheets.append(parsed)
+    finally:
+        wb.close()
+    
+    return sheets
+
+
 def parse_multiple_files(file_paths: list[str]) -> dict[FileType, list[ParseResult]]:
-    """Parse multiple Excel files and group by type"""
+    """Parse multiple Excel files (in the shared worker pool, one task per file) and group by type"""
+    if min(len(file_paths), os.cpu_count() or 1) < 2:
+        return group_by_file_type(parse_excel_file(file_path) for file_path in file_paths)
+    
+    # The app's spawn-context pool: never fork the server process
+    from app.pipelines import get_process_pool
+    return group_by_file_type(get_process_pool().map(parse_excel_file, file_paths))
+
+
+def group_by_file_type(parse_results) -> dict[FileType, list[ParseResult]]:
+    """Group parse results by file type (every type present, input order kept)"""
     results: dict[FileType, list[ParseResult]] = {ft: [] for ft in FileType}
     
-    for file_path in file_paths:
-        result = parse_excel_file(file_path)
+    for result in parse_results:
         results[result.file_type].append(result)
     
     return results
@@ -2,8 +2,12 @@
 RAIS Backend - Validation Pipeline
 Validates parsed data with cross-file reconciliation and traceability
 """
+from datetime import date, datetime
 from typing import Optional
 from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
 
 from app.models import FileType, DataSource, ValidationError as ValidationErrorModel
 
@@ -27,6 +31,15 @@ class ValidationResult:
         self.valid_rows = 0
         self.error_rows = 0
     
+    def merge(self, other: 'ValidationResult'):
+        """Append another result's findings and counts (e.g. from a per-file validation)"""
+        self.valid = self.valid and other.valid
+        self.errors.extend(other.errors)
+        self.warnings.extend(other.warnings)
+        self.total_rows += other.total_rows
+        self.valid_rows += other.valid_rows
+        self.error_rows += other.error_rows
+    
     def add_error(
         self,
         message: str,
@@ -78,49 +91,143 @@ class ValidationResult:
 
 def find_column(row: dict, patterns: list[str]) -> tuple[Optional[str], Optional[any]]:
     """Find a column matching any of the patterns"""
+    patterns_upper = [pattern.upper() for pattern in patterns]
     for key in row:
         key_upper = key.upper()
-        for pattern in patterns:
-            if pattern.upper() in key_upper:
+        for pattern in patterns_upper:
+            if pattern in key_upper:
                 return key, row[key]
     return None, None
 
 
+# Joins headers for resolve_columns' scan (never part of a header or a pattern)
+_KEY_SEPARATOR = "\x1f"
+
+# field -> header patterns, for resolve_columns (patterns are upper case)
+PRODUCTION_COLUMNS = (
+    ("production", ("PRODUCTION", "PRODUCED", "PROD QTY")),
+    ("rejection", ("REJECTION", "REJECTED", "TOTAL REJ", "REJ QTY")),
+)
+INSPECTION_COLUMNS = (
+    ("received", ("RECEIVED", "REC QTY", "INPUT")),
+    ("inspected", ("INSPECTED", "INSP QTY", "CHECKED")),
+    ("accepted", ("ACCEPTED", "ACC QTY", "PASSED")),
+    ("rejected", ("REJECTED", "REJ QTY", "FAILED")),
+)
+
+
+@lru_cache(maxsize=256)
+def resolve_columns(
+    keys: tuple[str, ...],
+    pattern_groups: tuple[tuple[str, tuple[str, ...]], ...]
+) -> dict[str, Optional[str]]:
+    """
+    Column find_column would pick for each field, for a sheet with these keys.
+    
+    Every row of a sheet shares its keys, so headers are upper-cased and
+    matched once per sheet layout: one str.find per pattern over all the
+    headers joined, the earliest hit naming the column. The returned dict is
+    shared - don't modify it.
+    """
+    joined = _KEY_SEPARATOR.join(keys).upper()
+    columns = {}
+    for name, patterns in pattern_groups:
+        hits = [pos for pos in map(joined.find, patterns) if pos >= 0]
+        columns[name] = keys[joined.count(_KEY_SEPARATOR, 0, min(hits))] if hits else None
+    return columns
+
+
 def get_numeric(value) -> Optional[float]:
     """Convert value to numeric, handling strings"""
+    # Exact-type checks first: the common cell types skip the isinstance chain
+    value_type = type(value)
+    if value_type is float:
+        return value
+    if value_type is int:
+        return float(value)
     if value is None:
         return None
+    if value_type is str or isinstance(value, str):
+        return _parse_numeric(value)
     if isinstance(value, (int, float)):
         return float(value)
-    if isinstance(value, str):
-        try:
-            # Remove commas and whitespace
-            cleaned = value.replace(",", "").strip()
-            return float(cleaned)
-        except ValueError:
-            return None
     return None
 
 
+def _parse_numeric(text: str) -> Optional[float]:
+    """float() of a cell string, ignoring thousands separators (float() strips whitespace itself)"""
+    try:
+        return float(text.replace(",", "") if "," in text else text)
+    except ValueError:
+        return None
+
+
+def numeric_array(values: Optional[list], length: int) -> np.ndarray:
+    """get_numeric over a column as float64 - NaN where it gives None, or for a missing column"""
+    if values is None:
+        return np.full(length, np.nan)
+    try:
+        # Numbers, numeric strings and None (as NaN) convert in one C loop
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        # Thousands separators, text, dates - fall back to the per-cell rules
+        return np.fromiter(
+            (np.nan if num is None else num for num in map(get_numeric, values)),
+            dtype=np.float64,
+            count=len(values)
+        )
+
+
+def negative_mask(values: list, length: int) -> np.ndarray:
+    """numeric_array(values, length) < 0, converting only the cells that could be negative"""
+    try:
+        return np.array(values, dtype=np.float64) < 0
+    except (TypeError, ValueError):
+        pass
+    
+    # Text/date columns: a string needs a "-" to parse negative, None and
+    # dates never do - only the remaining cells go through get_numeric
+    mask = np.zeros(length, dtype=bool)
+    for i, value in enumerate(values):
+        value_type = type(value)
+        if value_type is str:
+            if "-" not in value:
+                continue
+        elif value is None or value_type is datetime or value_type is date:
+            continue
+        num = get_numeric(value)
+        if num is not None and num < 0:
+            mask[i] = True
+    return mask
+
+
 # ============================================================================
 # TYPE-SPECIFIC VALIDATORS
 # ============================================================================
 
-def validate_production_row(row: dict, sheet: 'ParsedSheet', result: ValidationResult, context: ValidationContext):
-    """Validate a production/cumulative row"""
-    row_num = row.get("_source_row", 0)
+# Each validator checks a whole sheet with array comparisons (NaN - a missing or
+# non-numeric cell - fails every comparison, like a None check), then reports
+# only the flagged rows, in row order.
+
+def validate_production_sheet(sheet: 'ParsedSheet', result: ValidationResult, context: ValidationContext):
+    """Validate the rows of a production/cumulative sheet"""
+    count = sheet.row_count
     
-    # Find production quantity
-    _, prod_value = find_column(row, ["PRODUCTION", "PRODUCED", "PROD QTY"])
-    prod_num = get_numeric(prod_value)
+    # Find production and rejection quantities
+    cols = resolve_columns(tuple(sheet.columns), PRODUCTION_COLUMNS)
+    prod = numeric_array(sheet.columns.get(cols["production"]), count)
+    rej = numeric_array(sheet.columns.get(cols["rejection"]), count)
     
-    # Find rejection quantity
-    _, rej_value = find_column(row, ["REJECTION", "REJECTED", "TOTAL REJ", "REJ QTY"])
-    rej_num = get_numeric(rej_value)
+    # Rejection cannot exceed production; negative values are flagged
+    over = rej > prod
+    negative_prod = prod < 0
+    negative_rej = rej < 0
     
-    # Validate: rejection cannot exceed production
-    if prod_num is not None and rej_num is not None:
-        if rej_num > prod_num:
+    for i in np.flatnonzero(over | negative_prod | negative_rej).tolist():
+        row_num = sheet.source_rows[i]
+        prod_num, rej_num = float(prod[i]), float(rej[i])
+        
+        if over[i]:
             result.add_error(
                 f"Rejection ({rej_num}) exceeds production ({prod_num})",
                 sheet.file_name,
@@ -129,87 +236,96 @@ def validate_production_row(row: dict, sheet: 'ParsedSheet', result: ValidationR
                 column="REJECTION",
                 value=str(rej_num)
             )
-    
-    # Check for negative values
-    if prod_num is not None and prod_num < 0:
-        result.add_warning(
-            f"Negative production value: {prod_num} (using absolute)",
-            sheet.file_name,
-            sheet.name,
-            row_num,
-            column="PRODUCTION",
-            value=str(prod_num)
-        )
-    
-    if rej_num is not None and rej_num < 0:
-        result.add_warning(
-            f"Negative rejection value: {rej_num} (using absolute)",
-            sheet.file_name,
-            sheet.name,
-            row_num,
-            column="REJECTION",
-            value=str(rej_num)
-        )
+        
+        if negative_prod[i]:
+            result.add_warning(
+                f"Negative production value: {prod_num} (using absolute)",
+                sheet.file_name,
+                sheet.name,
+                row_num,
+                column="PRODUCTION",
+                value=str(prod_num)
+            )
+        
+        if negative_rej[i]:
+            result.add_warning(
+                f"Negative rejection value: {rej_num} (using absolute)",
+                sheet.file_name,
+                sheet.name,
+                row_num,
+                column="REJECTION",
+                value=str(rej_num)
+            )
 
 
-def validate_inspection_row(row: dict, sheet: 'ParsedSheet', result: ValidationResult, context: ValidationContext):
-    """Validate an inspection row (assembly, visual, integrity, shopfloor)"""
-    row_num = row.get("_source_row", 0)
+def validate_inspection_sheet(sheet: 'ParsedSheet', result: ValidationResult, context: ValidationContext):
+    """Validate the rows of an inspection sheet (assembly, visual, integrity, shopfloor), incl. defect counts"""
+    count = sheet.row_count
     
     # Find quantities
-    _, received = find_column(row, ["RECEIVED", "REC QTY", "INPUT"])
-    _, inspected = find_column(row, ["INSPECTED", "INSP QTY", "CHECKED"])
-    _, accepted = find_column(row, ["ACCEPTED", "ACC QTY", "PASSED"])
-    _, rejected = find_column(row, ["REJECTED", "REJ QTY", "FAILED"])
+    cols = resolve_columns(tuple(sheet.columns), INSPECTION_COLUMNS)
+    received_num = numeric_array(sheet.columns.get(cols["received"]), count)
+    inspected_num = numeric_array(sheet.columns.get(cols["inspected"]), count)
+    accepted_num = numeric_array(sheet.columns.get(cols["accepted"]), count)
+    rejected_num = numeric_array(sheet.columns.get(cols["rejected"]), count)
+    
+    # Accepted + rejected should equal inspected (1 unit tolerance)
+    total = accepted_num + rejected_num
+    mismatch = np.abs(total - inspected_num) > 1
+    # Rejected cannot exceed received
+    over = rejected_num > received_num
     
-    received_num = get_numeric(received)
-    inspected_num = get_numeric(inspected)
-    accepted_num = get_numeric(accepted)
-    rejected_num = get_numeric(rejected)
+    # Negative defect counts, checked in every column (quantity columns are
+    # already converted)
+    converted = {
+        cols["received"]: received_num,
+        cols["inspected"]: inspected_num,
+        cols["accepted"]: accepted_num,
+        cols["rejected"]: rejected_num,
+    }
+    negative = [
+        (key, values, converted[key] < 0 if key in converted else negative_mask(values, count))
+        for key, values in sheet.columns.items()
+        if not key.startswith("_")
+    ]
     
-    # Validate: accepted + rejected should equal inspected (with tolerance)
-    if accepted_num is not None and rejected_num is not None and inspected_num is not None:
-        total = accepted_num + rejected_num
-        if abs(total - inspected_num) > 1:  # Allow 1 unit tolerance
+    flagged = mismatch | over
+    for _, _, mask in negative:
+        flagged |= mask
+    
+    for i in np.flatnonzero(flagged).tolist():
+        row_num = sheet.source_rows[i]
+        
+        if mismatch[i]:
             result.add_warning(
-                f"Accepted ({accepted_num}) + Rejected ({rejected_num}) = {total} doesn't match Inspected ({inspected_num})",
+                f"Accepted ({float(accepted_num[i])}) + Rejected ({float(rejected_num[i])}) = {float(total[i])} "
+                f"doesn't match Inspected ({float(inspected_num[i])})",
                 sheet.file_name,
                 sheet.name,
                 row_num
             )
-    
-    # Validate: rejected cannot exceed received
-    if rejected_num is not None and received_num is not None:
-        if rejected_num > received_num:
+        
+        if over[i]:
             result.add_error(
-                f"Rejected ({rejected_num}) exceeds received ({received_num})",
+                f"Rejected ({float(rejected_num[i])}) exceeds received ({float(received_num[i])})",
                 sheet.file_name,
                 sheet.name,
                 row_num,
                 column="REJECTED",
-                value=str(rejected_num)
+                value=str(float(rejected_num[i]))
             )
-
-
-def validate_defect_row(row: dict, sheet: 'ParsedSheet', result: ValidationResult, context: ValidationContext):
-    """Validate defect counts"""
-    row_num = row.get("_source_row", 0)
-    
-    # Check for negative defect counts
-    for key, value in row.items():
-        if key.startswith("_"):
-            continue
         
-        num = get_numeric(value)
-        if num is not None and num < 0:
-            result.add_warning(
-                f"Negative defect count: {value} (using absolute)",
-                sheet.file_name,
-                sheet.name,
-                row_num,
-                column=key,
-                value=str(value)
-            )
+        for key, values, mask in negative:
+            if mask[i]:
+                value = values[i]
+                result.add_warning(
+                    f"Negative defect count: {value} (using absolute)",
+                    sheet.file_name,
+                    sheet.name,
+                    row_num,
+                    column=key,
+                    value=str(value)
+                )
 
 
 # ============================================================================
@@ -251,13 +367,11 @@ def validate_parsed_data(
             for sheet in parse_result.sheets:
                 result.total_rows += sheet.row_count
                 
-                for row in sheet.data:
-                    # Apply type-specific validation
-                    if file_type in [FileType.PRODUCTION_CUMULATIVE, FileType.CUMULATIVE]:
-                        validate_production_row(row, sheet, result, context)
-                    elif file_type in [FileType.ASSEMBLY, FileType.VISUAL, FileType.INTEGRITY, FileType.SHOPFLOOR]:
-                        validate_inspection_row(row, sheet, result, context)
-                        validate_defect_row(row, sheet, result, context)
+                # Apply type-specific validation
+                if file_type in [FileType.PRODUCTION_CUMULATIVE, FileType.CUMULATIVE]:
+                    validate_production_sheet(sheet, result, context)
+                elif file_type in [FileType.ASSEMBLY, FileType.VISUAL, FileType.INTEGRITY, FileType.SHOPFLOOR]:
+                    validate_inspection_sheet(sheet, result, context)
     
     result.valid_rows = result.total_rows - result.error_rows
     
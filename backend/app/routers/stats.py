@@ -5,10 +5,12 @@ Handles statistics queries and data export
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
-import io
-import json
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+import csv
+import hashlib
+
+import orjson
 
 from app.models import (
     StatsFilter,
@@ -27,7 +29,7 @@ from app.models import (
     DefectCategory,
     Severity,
 )
-from app.db import get_latest_stats
+from app.db import get_latest_stats, get_latest_stats_raw, get_latest_kpis
 
 router = APIRouter()
 
@@ -83,6 +85,15 @@ async def get_stats(filters: Optional[StatsFilter] = None):
     
     Returns KPIs, trends, pareto charts, and visual inspection focus data.
     """
+    # Latest computed stats as stored: our own StatsResponse dump, so validate
+    # it straight from the JSON bytes (no intermediate dict, no kwargs copy)
+    raw_stats = await get_latest_stats_raw()
+    if raw_stats is not None:
+        try:
+            return StatsResponse.model_validate_json(raw_stats)
+        except ValueError:
+            return _generate_mock_stats()
+    
     # Get latest computed stats from database
     stats_data = await get_latest_stats()
     
@@ -105,6 +116,19 @@ async def get_overview():
     Get quick overview stats for dashboard.
     Returns condensed KPIs without full chart data.
     """
+    # Fast path: KPI columns, no need to decode the full stats blob
+    latest = await get_latest_kpis()
+    if latest:
+        return {
+            "has_data": True,
+            "rejection_rate": latest["rejection_rate"],
+            "yield_rate": latest["yield_rate"] if latest["yield_rate"] is not None else 100,
+            "total_produced": latest["total_produced"] or 0,
+            "total_rejected": latest["total_rejected"] or 0,
+            "watch_batches": latest["watch_batches"] or 0,
+            "generated_at": latest["generated_at"]
+        }
+    
     stats_data = await get_latest_stats()
     
     if not stats_data:
@@ -128,6 +152,46 @@ async def get_overview():
         return {"has_data": False, "message": "Error reading stats"}
 
 
+class _CSVLine:
+    """File-like target for csv.writer that hands each formatted row back"""
+    def write(self, line: str) -> str:
+        return line
+
+
+# Rows per chunk of a streamed CSV export
+_CSV_CHUNK_ROWS = 512
+
+
+async def _csv_export(stats_data: dict):
+    """KPIs and defect pareto as CSV, yielded in encoded chunks (csv quotes names with commas/quotes)"""
+    writer = csv.writer(_CSVLine(), lineterminator="\n")
+    
+    kpis = stats_data.get("kpis", {})
+    yield "".join(map(writer.writerow, [
+        ["Metric", "Value", "Source"],
+        ["Rejection Rate", f"{kpis.get('rejection_rate', 0)}%", "Computed"],
+        ["Yield Rate", f"{kpis.get('yield_rate', 0)}%", "Computed"],
+        ["Total Produced", kpis.get("total_produced", 0), "Aggregated"],
+        ["Total Rejected", kpis.get("total_rejected", 0), "Aggregated"],
+        ["Financial Impact", f"INR {kpis.get('financial_impact', 0)}", "Computed"],
+        [],
+        ["Defect", "Count", "Percentage", "Cumulative %"],
+    ])).encode()
+    
+    # Add defect pareto
+    defects = stats_data.get("defect_pareto", {}).get("defects", [])
+    for start in range(0, len(defects), _CSV_CHUNK_ROWS):
+        yield "".join(
+            writer.writerow([
+                defect.get("defect_name", ""),
+                defect.get("count", 0),
+                f"{defect.get('percentage', 0)}%",
+                f"{defect.get('cumulative_percentage', 0)}%",
+            ])
+            for defect in defects[start:start + _CSV_CHUNK_ROWS]
+        ).encode()
+
+
 @router.get("/export")
 async def export_data(
     format: ExportFormat = Query(ExportFormat.CSV, description="Export format"),
@@ -141,42 +205,36 @@ async def export_data(
     - JSON: Full data export
     - PDF: Report with charts (requires kaleido)
     """
+    if format == ExportFormat.JSON:
+        # The stored JSON is already the export body; send it as-is
+        raw_stats = await get_latest_stats_raw()
+        if raw_stats is not None:
+            return Response(
+                content=raw_stats,
+                media_type="application/json",
+                headers={"Content-Disposition": "attachment; filename=rais_stats.json"}
+            )
+    
     stats_data = await get_latest_stats()
     
     if not stats_data:
         raise HTTPException(status_code=404, detail="No data available for export")
     
     if format == ExportFormat.JSON:
-        content = json.dumps(stats_data, indent=2, default=str)
-        return StreamingResponse(
-            io.BytesIO(content.encode()),
+        content = orjson.dumps(
+            stats_data,
+            default=str,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC,
+        )
+        return Response(
+            content=content,
             media_type="application/json",
             headers={"Content-Disposition": "attachment; filename=rais_stats.json"}
         )
     
     elif format == ExportFormat.CSV:
-        # Generate CSV with KPIs and defect data
-        lines = ["Metric,Value,Source"]
-        
-        kpis = stats_data.get("kpis", {})
-        lines.append(f"Rejection Rate,{kpis.get('rejection_rate', 0)}%,Computed")
-        lines.append(f"Yield Rate,{kpis.get('yield_rate', 0)}%,Computed")
-        lines.append(f"Total Produced,{kpis.get('total_produced', 0)},Aggregated")
-        lines.append(f"Total Rejected,{kpis.get('total_rejected', 0)},Aggregated")
-        lines.append(f"Financial Impact,INR {kpis.get('financial_impact', 0)},Computed")
-        
-        # Add defect pareto
-        lines.append("")
-        lines.append("Defect,Count,Percentage,Cumulative %")
-        for defect in stats_data.get("defect_pareto", {}).get("defects", []):
-            lines.append(
-                f"{defect.get('defect_name', '')},{defect.get('count', 0)},"
-                f"{defect.get('percentage', 0)}%,{defect.get('cumulative_percentage', 0)}%"
-            )
-        
-        content = "\n".join(lines)
         return StreamingResponse(
-            io.BytesIO(content.encode()),
+            _csv_export(stats_data),
             media_type="text/csv",
             headers={"Content-Disposition": "attachment; filename=rais_stats.csv"}
         )
@@ -189,41 +247,63 @@ async def export_data(
         )
 
 
+# Reference lists for /defects and /stages: constant, so serialized once with an ETag
+DEFECT_TYPES = [
+    {"code": "COAG", "name": "Coagulation", "category": "material", "severity": "major"},
+    {"code": "RAISED_WIRE", "name": "Raised Wire", "category": "dimensional", "severity": "major"},
+    {"code": "SURFACE_DEFECT", "name": "Surface Defect", "category": "visual", "severity": "minor"},
+    {"code": "OVERLAPING", "name": "Overlapping", "category": "dimensional", "severity": "minor"},
+    {"code": "BLACK_MARK", "name": "Black Mark", "category": "visual", "severity": "minor"},
+    {"code": "WEBBING", "name": "Webbing", "category": "material", "severity": "major"},
+    {"code": "MISSING_FORMERS", "name": "Missing Formers", "category": "functional", "severity": "critical"},
+    {"code": "LEAKAGE", "name": "Leakage", "category": "functional", "severity": "critical"},
+    {"code": "BUBBLE", "name": "Bubble", "category": "material", "severity": "minor"},
+    {"code": "THIN_SPOD", "name": "Thin Spod", "category": "dimensional", "severity": "minor"},
+    {"code": "PIN_HOLE", "name": "Pin Hole", "category": "visual", "severity": "major"},
+    {"code": "BAD_STRIPPING", "name": "Bad Stripping", "category": "functional", "severity": "major"},
+]
+
+STAGES = [
+    {"code": "SHOPFLOOR", "name": "Shopfloor Rejection", "sequence": 1},
+    {"code": "ASSEMBLY", "name": "Assembly Inspection", "sequence": 2},
+    {"code": "VISUAL", "name": "Visual Inspection", "sequence": 3},
+    {"code": "INTEGRITY", "name": "Balloon & Valve Integrity", "sequence": 4},
+    {"code": "FINAL", "name": "Final Inspection", "sequence": 5},
+]
+
+
+def _static_json(payload: dict) -> tuple[bytes, str]:
+    """Serialized body and its (strong) ETag"""
+    body = orjson.dumps(payload)
+    return body, f'"{hashlib.md5(body).hexdigest()}"'
+
+
+_DEFECTS_JSON, _DEFECTS_ETAG = _static_json({"defects": DEFECT_TYPES})
+_STAGES_JSON, _STAGES_ETAG = _static_json({"stages": STAGES})
+
+
+def _static_response(body: bytes, etag: str, if_none_match: Optional[str]) -> Response:
+    """The precomputed body, or 304 Not Modified when the client already has it"""
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
 @router.get("/defects")
-async def get_defect_list():
+async def get_defect_list(if_none_match: Optional[str] = Header(None)):
     """
     Get list of known defect types with categories and severities.
     Useful for filtering and display.
     """
-    return {
-        "defects": [
-            {"code": "COAG", "name": "Coagulation", "category": "material", "severity": "major"},
-            {"code": "RAISED_WIRE", "name": "Raised Wire", "category": "dimensional", "severity": "major"},
-            {"code": "SURFACE_DEFECT", "name": "Surface Defect", "category": "visual", "severity": "minor"},
-            {"code": "OVERLAPING", "name": "Overlapping", "category": "dimensional", "severity": "minor"},
-            {"code": "BLACK_MARK", "name": "Black Mark", "category": "visual", "severity": "minor"},
-            {"code": "WEBBING", "name": "Webbing", "category": "material", "severity": "major"},
-            {"code": "MISSING_FORMERS", "name": "Missing Formers", "category": "functional", "severity": "critical"},
-            {"code": "LEAKAGE", "name": "Leakage", "category": "functional", "severity": "critical"},
-            {"code": "BUBBLE", "name": "Bubble", "category": "material", "severity": "minor"},
-            {"code": "THIN_SPOD", "name": "Thin Spod", "category": "dimensional", "severity": "minor"},
-            {"code": "PIN_HOLE", "name": "Pin Hole", "category": "visual", "severity": "major"},
-            {"code": "BAD_STRIPPING", "name": "Bad Stripping", "category": "functional", "severity": "major"},
-        ]
-    }
+    return _static_response(_DEFECTS_JSON, _DEFECTS_ETAG, if_none_match)
 
 
 @router.get("/stages")
-async def get_stage_list():
+async def get_stage_list(if_none_match: Optional[str] = Header(None)):
     """
     Get list of inspection stages in sequence order.
     """
-    return {
-        "stages": [
-            {"code": "SHOPFLOOR", "name": "Shopfloor Rejection", "sequence": 1},
-            {"code": "ASSEMBLY", "name": "Assembly Inspection", "sequence": 2},
-            {"code": "VISUAL", "name": "Visual Inspection", "sequence": 3},
-            {"code": "INTEGRITY", "name": "Balloon & Valve Integrity", "sequence": 4},
-            {"code": "FINAL", "name": "Final Inspection", "sequence": 5},
-        ]
-    }
+    return _static_response(_STAGES_JSON, _STAGES_ETAG, if_none_match)
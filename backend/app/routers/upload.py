@@ -5,9 +5,14 @@ Handles file uploads and processing status polling
 from uuid import uuid4, UUID
 from datetime import datetime
 from pathlib import Path
+import io
+import os
 import shutil
 
 from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from starlette.formparsers import MultiPartParser
 
 from app.config import settings
 from app.models import (
@@ -15,11 +20,63 @@ from app.models import (
     ProcessingStatusResponse,
     ProcessingStatus,
 )
-from app.db import create_session, update_session, get_session
+from app.db import (
+    create_session,
+    update_session,
+    get_session,
+    get_all_sessions,
+    get_processed_data,
+    reset_db,
+)
 from app.pipelines import process_files
 
 router = APIRouter()
 
+# Copy buffer for uploads still held in memory (copyfileobj defaults to 64 KiB)
+_COPY_BUFSIZE = 1 << 20
+
+
+def _save_upload(upload: UploadFile, file_path: Path):
+    """Write an uploaded file to disk (blocking - runs in the thread pool)"""
+    src = upload.file
+    with open(file_path, "wb") as out:
+        # Starlette spools uploads larger than spool_max_size to a temp file;
+        # those are copied in the kernel. (fileno() on a smaller, in-memory
+        # upload would first write it out to disk.)
+        if upload.size is not None and upload.size > MultiPartParser.spool_max_size and hasattr(os, "sendfile"):
+            try:
+                in_fd, out_fd = src.fileno(), out.fileno()
+                size, offset = os.fstat(in_fd).st_size, 0
+                while offset < size:
+                    sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return
+            except (io.UnsupportedOperation, OSError):
+                out.seek(0)
+                out.truncate()
+        shutil.copyfileobj(src, out, _COPY_BUFSIZE)
+
+
+def _file_ext(filename: str) -> str:
+    """Lower-cased extension including the dot, "" if there is none"""
+    dot = filename.rfind(".")
+    return filename[dot:].lower() if dot > 0 else ""
+
+
+def _make_upload_dir(upload_id: UUID) -> Path:
+    """Create the directory for one upload (settings.upload_dir exists from startup)"""
+    upload_dir = settings.upload_dir / upload_id.hex
+    try:
+        os.mkdir(upload_dir)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        # The uploads root was removed while running
+        upload_dir.mkdir(parents=True, exist_ok=True)
+    return upload_dir
+
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_files(
@@ -48,7 +105,7 @@ async def upload_files(
     
     # Validate file extensions
     for file in files:
-        ext = Path(file.filename or "").suffix.lower()
+        ext = _file_ext(file.filename or "")
         if ext not in settings.allowed_extensions:
             raise HTTPException(
                 status_code=400,
@@ -57,16 +114,15 @@ async def upload_files(
     
     # Generate upload ID
     upload_id = uuid4()
-    upload_dir = settings.upload_dir / str(upload_id)
-    upload_dir.mkdir(parents=True, exist_ok=True)
+    upload_dir = _make_upload_dir(upload_id)
     
     # Save files to disk
     saved_files = []
     try:
         for file in files:
             file_path = upload_dir / file.filename
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            # Off the event loop, so other requests aren't blocked by the copy
+            await run_in_threadpool(_save_upload, file, file_path)
             saved_files.append(str(file_path))
     except Exception as e:
         # Cleanup on failure
@@ -124,9 +180,9 @@ async def cancel_upload(upload_id: UUID):
         raise HTTPException(status_code=404, detail="Upload not found")
     
     # Cleanup files
-    upload_dir = settings.upload_dir / str(upload_id)
-    if upload_dir.exists():
-        shutil.rmtree(upload_dir, ignore_errors=True)
+    # Uploads from before the switch to hex names used the dashed form
+    for dir_name in (upload_id.hex, str(upload_id)):
+        shutil.rmtree(settings.upload_dir / dir_name, ignore_errors=True)
     
     # Update status
     await update_session(
@@ -144,27 +200,29 @@ async def get_upload_history():
     """
     Get history of recent uploads.
     """
-    from app.db import get_all_sessions
     sessions = await get_all_sessions()
-    return [
-        ProcessingStatusResponse(
-            upload_id=s["upload_id"],
-            status=s["status"],
-            progress_percent=s["progress_percent"],
-            current_stage=s["current_stage"],
-            files_processed=s["files_processed"],
-            total_files=s["files_received"],
-            errors=s["errors"],
-            started_at=s["started_at"],
-            completed_at=s["completed_at"],
-            file_name=s.get("file_name"),
-            file_size_bytes=s.get("file_size_bytes"),
-            records_valid=s.get("records_valid"),
-            records_invalid=s.get("records_invalid"),
-            detected_file_type=s.get("detected_file_type")
-        )
+    # get_all_sessions already returns checked, typed values: build the
+    # response_model shape as dicts and encode them directly, skipping a
+    # model instance (and its validation) per row
+    return ORJSONResponse([
+        {
+            "upload_id": s["upload_id"],
+            "status": s["status"],
+            "progress_percent": s["progress_percent"],
+            "current_stage": s["current_stage"],
+            "files_processed": s["files_processed"],
+            "total_files": s["files_received"],
+            "errors": s["errors"],
+            "started_at": s["started_at"],
+            "completed_at": s["completed_at"],
+            "file_name": s.get("file_name"),
+            "file_size_bytes": s.get("file_size_bytes"),
+            "records_valid": s.get("records_valid"),
+            "records_invalid": s.get("records_invalid"),
+            "detected_file_type": s.get("detected_file_type")
+        }
         for s in sessions
-    ]
+    ])
 
 @router.get("/uploads/{upload_id}/data")
 async def get_upload_data(upload_id: UUID):
@@ -172,7 +230,6 @@ async def get_upload_data(upload_id: UUID):
     Get processed data for a specific upload.
     Returns raw data and validated data record counts/details.
     """
-    from app.db import get_processed_data
     data = await get_processed_data(upload_id)
     
     if not data:
@@ -183,10 +240,8 @@ async def get_upload_data(upload_id: UUID):
 @router.post("/reset")
 async def reset_database():
     """Clear all processed data and session history"""
-    from app.db import reset_db
     await reset_db()
     # Also cleanup upload files
-    import shutil
     if settings.upload_dir.exists():
         for item in settings.upload_dir.iterdir():
             if item.is_dir():
@@ -0,0 +1,431 @@
+"""
+RAIS Backend - Database Session Tests
+"""
+import asyncio
+import json
+import pytest
+import aiosqlite
+import sqlite3
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+from app.db import session
+from app.models import ProcessingStatus
+
+
+@pytest.fixture
+async def db_path(tmp_path, monkeypatch):
+    """Point the session layer at a throwaway SQLite file"""
+    path = tmp_path / "rais_test.db"
+    monkeypatch.setattr(session, "SQLITE_DB_PATH", path)
+    monkeypatch.setattr(session, "_latest_cache", None)
+    await session.init_db()
+    yield path
+    await session.close_db()
+
+
+class TestSessionStore:
+    """Test SQLite session persistence"""
+
+    async def test_wal_enabled(self, db_path):
+        async with aiosqlite.connect(db_path) as db:
+            async with db.execute("PRAGMA journal_mode") as cursor:
+                row = await cursor.fetchone()
+        assert row[0] == "wal"
+
+    async def test_session_round_trip(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 3)
+        await session.update_session(
+            upload_id,
+            status=ProcessingStatus.PARSING,
+            progress_percent=40,
+            errors=["bad row"]
+        )
+
+        result = await session.get_session(upload_id)
+        assert result["upload_id"] == upload_id
+        assert result["status"] == ProcessingStatus.PARSING
+        assert result["progress_percent"] == 40
+        assert result["files_received"] == 3
+        assert result["errors"] == ["bad row"]
+
+    async def test_latest_stats(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        assert await session.get_latest_stats() is None
+
+        stats = {"kpis": {"rejection_rate": 1.5, "total_produced": 100}}
+        await session.save_processed_data(upload_id, raw_data={"visual": []})
+        await session.save_processed_data(upload_id, computed_stats=stats)
+
+        assert await session.get_latest_stats() == stats
+        data = await session.get_processed_data(upload_id)
+        assert data["raw_data"] == {"visual": []}
+        assert data["computed_stats"] == stats
+
+    async def test_raw_data_stored_compressed(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        raw = {"visual": [{"row": i, "defect": "scratch"} for i in range(200)]}
+        await session.save_processed_data(upload_id, raw_data=raw)
+
+        async with aiosqlite.connect(db_path) as db:
+            async with db.execute("SELECT raw_data FROM processed_data") as cursor:
+                (blob,) = await cursor.fetchone()
+        assert blob.startswith(session._ZSTD_MAGIC)
+        assert len(blob) < len(session._dumps(raw))
+        assert (await session.get_processed_data(upload_id))["raw_data"] == raw
+
+    async def test_computed_stats_stored_compressed(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        stats = {"kpis": {"rejection_rate": 2.0}, "trends": [{"month": "Jan", "rate": i} for i in range(200)]}
+        await session.save_processed_data(upload_id, computed_stats=stats)
+
+        async with aiosqlite.connect(db_path) as db:
+            async with db.execute("SELECT computed_stats FROM processed_data") as cursor:
+                (blob,) = await cursor.fetchone()
+        assert blob.startswith(session._ZSTD_MAGIC)
+        assert (await session.get_processed_data(upload_id))["computed_stats"] == stats
+        assert await session.get_latest_stats() == stats
+
+    async def test_latest_stats_uses_index(self, db_path):
+        async with aiosqlite.connect(db_path) as db:
+            async with db.execute(
+                "EXPLAIN QUERY PLAN SELECT computed_stats FROM processed_data "
+                "WHERE computed_stats IS NOT NULL ORDER BY created_at DESC LIMIT 1"
+            ) as cursor:
+                plan = " ".join(row[-1] for row in await cursor.fetchall())
+        assert "idx_processed_stats_notnull" in plan
+
+    async def test_latest_kpis_from_columns(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        assert await session.get_latest_kpis() is None
+
+        stats = {
+            "kpis": {"rejection_rate": 2.5, "yield_rate": 97.5, "total_produced": 400,
+                     "total_rejected": 10, "financial_impact": 3650.0, "watch_batches": 1},
+            "generated_at": "2025-05-01T00:00:00",
+        }
+        await session.save_processed_data(upload_id, computed_stats=stats)
+        # A later partial save must not wipe the KPI columns
+        await session.save_processed_data(upload_id, raw_data={"visual": []})
+
+        kpis = await session.get_latest_kpis()
+        assert kpis["rejection_rate"] == 2.5
+        assert kpis["total_produced"] == 400
+        assert kpis["financial_loss"] == 3650.0
+        assert kpis["generated_at"] == "2025-05-01T00:00:00"
+
+    async def test_all_sessions_summary(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        await session.save_processed_data(upload_id, raw_data={"unknown": [], "visual": []})
+        await session.save_processed_data(upload_id, validated_data={"valid_rows": 8, "error_rows": 2})
+
+        sessions = await session.get_all_sessions()
+        assert len(sessions) == 1
+        assert sessions[0]["upload_id"] == upload_id
+        assert sessions[0]["records_valid"] == 8
+        assert sessions[0]["records_invalid"] == 2
+        assert sessions[0]["detected_file_type"] == "visual"
+
+    async def test_session_batch_coalesces(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 2)
+        async with session.session_batch(upload_id) as batch:
+            batch.set(progress_percent=40, current_stage="Parsed", files_processed=2)
+            batch.set(status=ProcessingStatus.VALIDATING, progress_percent=50)
+
+        result = await session.get_session(upload_id)
+        assert result["status"] == ProcessingStatus.VALIDATING
+        assert result["progress_percent"] == 50
+        assert result["current_stage"] == "Parsed"
+        assert result["files_processed"] == 2
+
+    async def test_bulk_create_and_update_sessions(self, db_path):
+        ids = [uuid4() for _ in range(3)]
+        created = await session.create_sessions([(upload_id, n) for n, upload_id in enumerate(ids, 1)])
+        assert [c["files_received"] for c in created] == [1, 2, 3]
+
+        await session.update_sessions([
+            (ids[0], {"progress_percent": 30}),
+            (ids[1], {"status": ProcessingStatus.PARSING, "current_stage": "Parsing"}),
+            (ids[2], {}),
+        ])
+        first, second, third = [await session.get_session(upload_id) for upload_id in ids]
+        assert first["progress_percent"] == 30 and first["status"] == ProcessingStatus.UPLOADING
+        assert second["status"] == ProcessingStatus.PARSING and second["current_stage"] == "Parsing"
+        assert third["files_received"] == 3 and third["progress_percent"] == 0
+
+    async def test_errors_round_trip_and_must_be_json(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        assert (await session.get_session(upload_id))["errors"] == []
+
+        await session.update_session(upload_id, errors=["Bad row 4"])
+        assert (await session.get_session(upload_id))["errors"] == ["Bad row 4"]
+
+        with pytest.raises(sqlite3.IntegrityError):
+            await session._write(("UPDATE upload_sessions SET errors = 'oops'", ()))
+
+    async def test_optimize_collects_planner_stats(self, db_path):
+        for _ in range(3):
+            upload_id = uuid4()
+            await session.create_session(upload_id, 1)
+            await session.save_processed_data(upload_id, computed_stats={"kpis": {"rejection_rate": 1.0}})
+        await session.optimize_db()
+
+        async with aiosqlite.connect(db_path) as db:
+            async with db.execute("SELECT DISTINCT tbl FROM sqlite_stat1") as cursor:
+                tables = {row[0] for row in await cursor.fetchall()}
+        assert {"upload_sessions", "processed_data"} <= tables
+
+    async def test_update_session_and_save_is_atomic(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        await session.update_session_and_save(
+            upload_id,
+            session_updates=dict(status=ProcessingStatus.VALIDATING, progress_percent=50),
+            processed_payload={"validated_data": {"valid_rows": 3, "error_rows": 0}}
+        )
+        assert (await session.get_session(upload_id))["progress_percent"] == 50
+        assert (await session.get_processed_data(upload_id))["validated_data"]["valid_rows"] == 3
+
+        # If the save fails, the session update must not be applied either
+        await session._write((
+            "CREATE TRIGGER fail_save BEFORE UPDATE ON processed_data BEGIN SELECT RAISE(ABORT, 'boom'); END",
+            ()
+        ))
+        with pytest.raises(sqlite3.IntegrityError):
+            await session.update_session_and_save(
+                upload_id,
+                session_updates=dict(status=ProcessingStatus.COMPUTING, progress_percent=80),
+                processed_payload={"validated_data": {"valid_rows": 4, "error_rows": 0}}
+            )
+        assert (await session.get_session(upload_id))["progress_percent"] == 50
+
+    async def test_failed_write_is_isolated_in_batch(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+
+        # Both ops land in the same writer batch; the duplicate insert must fail alone
+        results = await asyncio.gather(
+            session.create_session(upload_id, 1),
+            session.update_session(upload_id, progress_percent=90),
+            return_exceptions=True
+        )
+        assert isinstance(results[0], sqlite3.IntegrityError)
+        assert results[1] is None
+        assert (await session.get_session(upload_id))["progress_percent"] == 90
+
+    async def test_reset_db(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        await session.save_processed_data(upload_id, computed_stats={"kpis": {"rejection_rate": 1.0}})
+
+        await session.reset_db()
+        assert await session.get_session(upload_id) is None
+        assert await session.get_latest_stats() is None
+
+    async def test_latest_stats_cached_copies(self, db_path):
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        await session.save_processed_data(upload_id, computed_stats={"kpis": {"rejection_rate": 3.0}})
+
+        first = await session.get_latest_stats()
+        assert session._latest_cache is not None
+        # Callers get their own dict; mutating it must not corrupt the cache
+        first["kpis"]["rejection_rate"] = 99.0
+        assert (await session.get_latest_stats())["kpis"]["rejection_rate"] == 3.0
+
+        await session.reset_db()
+        assert await session.get_latest_stats() is None
+
+    async def test_latest_stats_and_kpis_agree(self, db_path):
+        older, newer = uuid4(), uuid4()
+        for upload_id, created_at in ((older, 1746086400000), (newer, 1746090000000)):
+            await session.create_session(upload_id, 1)
+            await session.save_processed_data(upload_id, raw_data={"visual": []})
+            await session._write((
+                "UPDATE processed_data SET created_at = ? WHERE upload_id = ?",
+                (created_at, upload_id.bytes)
+            ))
+
+        # The older upload finishes last, but "latest" follows row creation order
+        await session.save_processed_data(newer, computed_stats={"kpis": {"rejection_rate": 2.0}})
+        assert (await session.get_latest_kpis())["rejection_rate"] == 2.0
+        await session.save_processed_data(older, computed_stats={"kpis": {"rejection_rate": 1.0}})
+
+        assert (await session.get_latest_stats())["kpis"]["rejection_rate"] == 2.0
+        assert (await session.get_latest_kpis())["rejection_rate"] == 2.0
+
+    async def test_pg_sync_failure_does_not_fail_save(self, db_path, monkeypatch):
+        class BrokenEngine:
+            def begin(self):
+                raise ConnectionError("supabase unreachable")
+
+        monkeypatch.setattr(session, "pg_engine", BrokenEngine())
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        stats = {"kpis": {"rejection_rate": 4.0}}
+        await session.save_processed_data(upload_id, computed_stats=stats)
+
+        assert (await session.get_processed_data(upload_id))["computed_stats"] == stats
+
+    async def test_readers_are_pooled(self, db_path):
+        async with session._reader() as first, session._reader() as second:
+            assert first is not second
+        assert session._read_pool.qsize() == len(session._readers)
+
+    async def test_read_connection_rejects_writes(self, db_path):
+        async with session._reader() as db:
+            with pytest.raises(sqlite3.OperationalError):
+                await db.execute("DELETE FROM upload_sessions")
+
+    async def test_writer_failure_fails_pending_and_later_writes(self, db_path, monkeypatch):
+        async def broken_batch(db, ops):
+            raise OSError("disk gone")
+
+        monkeypatch.setattr(session, "_run_batch", broken_batch)
+        with pytest.raises(OSError):
+            await session.create_session(uuid4(), 1)
+        # The writer is dead: later writes fail fast instead of hanging
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(session.create_session(uuid4(), 1), timeout=1)
+
+        with pytest.raises(OSError):
+            await session.close_db()
+        assert session._readers == [] and session._write_db is None
+
+
+    async def test_pg_not_written_when_sqlite_save_fails(self, db_path, monkeypatch):
+        batches = []
+
+        class RecordingEngine:
+            @asynccontextmanager
+            async def begin(self):
+                yield SimpleNamespace(execute=AsyncMock(side_effect=lambda sql, rows: batches.append(rows)))
+
+        async def broken_write(*statements):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(session, "pg_engine", RecordingEngine())
+        monkeypatch.setattr(session, "_last_kpi_digest", None)
+        monkeypatch.setattr(session, "_write", broken_write)
+        with pytest.raises(sqlite3.OperationalError):
+            await session.save_processed_data(uuid4(), computed_stats={"kpis": {"rejection_rate": 5.0}})
+        await session.close_db()
+        assert batches == []
+
+    async def test_pg_kpis_batched_and_deduplicated(self, db_path, monkeypatch):
+        batches = []
+
+        class RecordingEngine:
+            @asynccontextmanager
+            async def begin(self):
+                yield SimpleNamespace(execute=AsyncMock(side_effect=lambda sql, rows: batches.append(rows)))
+
+        monkeypatch.setattr(session, "pg_engine", RecordingEngine())
+        monkeypatch.setattr(session, "_last_kpi_digest", None)
+        monkeypatch.setattr(session, "KPI_FLUSH_INTERVAL_SECONDS", 0.01)
+        upload_id = uuid4()
+        await session.create_session(upload_id, 1)
+        stats = {"kpis": {"rejection_rate": 2.0, "total_produced": 50}}
+        await asyncio.gather(
+            session.save_processed_data(upload_id, computed_stats=stats),
+            session.save_processed_data(upload_id, computed_stats=dict(stats)),
+            session.save_processed_data(upload_id, computed_stats={"kpis": {"rejection_rate": 2.5}}),
+        )
+        await session.close_db()
+
+        # The duplicate snapshot is skipped and the rest share one insert
+        assert len(batches) == 1
+        assert [row["rr"] for row in batches[0]] == [2.0, 2.5]
+
+async def test_failed_init_closes_connections(tmp_path, monkeypatch):
+    monkeypatch.setattr(session, "SQLITE_DB_PATH", tmp_path / "rais_test.db")
+
+    async def broken_warm(db):
+        raise sqlite3.OperationalError("warmup failed")
+
+    monkeypatch.setattr(session, "_warm_statements", broken_warm)
+    with pytest.raises(sqlite3.OperationalError):
+        await session.init_db()
+    assert session._readers == [] and session._write_db is None
+
+    monkeypatch.undo()
+    monkeypatch.setattr(session, "SQLITE_DB_PATH", tmp_path / "rais_test.db")
+    await session.init_db()
+    await session.close_db()
+
+
+async def test_upgrades_baseline_schema(tmp_path, monkeypatch):
+    """A database written by the original schema (TEXT ids, JSON text) is migrated in place"""
+    path = tmp_path / "rais_legacy.db"
+    upload_id = uuid4()
+    stats = {"kpis": {"rejection_rate": 1.25, "total_produced": 800}}
+    with sqlite3.connect(path) as legacy:
+        legacy.executescript("""
+            CREATE TABLE upload_sessions (
+                upload_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'uploading',
+                progress_percent INTEGER DEFAULT 0,
+                current_stage TEXT DEFAULT 'Waiting',
+                files_received INTEGER DEFAULT 0,
+                files_processed INTEGER DEFAULT 0,
+                errors TEXT DEFAULT '[]',
+                started_at TEXT NOT NULL,
+                completed_at TEXT,
+                file_paths TEXT DEFAULT '[]',
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE processed_data (
+                upload_id TEXT PRIMARY KEY,
+                raw_data TEXT,
+                validated_data TEXT,
+                computed_stats TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (upload_id) REFERENCES upload_sessions(upload_id)
+            );
+        """)
+        legacy.execute(
+            "INSERT INTO upload_sessions (upload_id, status, progress_percent, files_received, "
+            "errors, started_at, completed_at) VALUES (?, 'completed', 100, 2, ?, ?, ?)",
+            (str(upload_id), json.dumps(["row 4 skipped"]), "2025-05-01T08:00:00", "2025-05-01T08:01:00")
+        )
+        legacy.execute(
+            "INSERT INTO processed_data (upload_id, raw_data, validated_data, computed_stats) VALUES (?, ?, ?, ?)",
+            (str(upload_id), json.dumps({"unknown": [], "inspection": []}),
+             json.dumps({"valid_rows": 12, "error_rows": 1}), json.dumps(stats))
+        )
+
+    monkeypatch.setattr(session, "SQLITE_DB_PATH", path)
+    monkeypatch.setattr(session, "_latest_cache", None)
+    await session.init_db()
+    try:
+        result = await session.get_session(upload_id)
+        assert result["status"] == ProcessingStatus.COMPLETED
+        assert result["errors"] == ["row 4 skipped"]
+        assert result["completed_at"].isoformat() == "2025-05-01T08:01:00"
+
+        sessions = await session.get_all_sessions()
+        assert [s["upload_id"] for s in sessions] == [upload_id]
+        assert sessions[0]["records_valid"] == 12
+        assert sessions[0]["records_invalid"] == 1
+        assert sessions[0]["detected_file_type"] == "inspection"
+
+        assert await session.get_latest_stats() == stats
+
+        async with aiosqlite.connect(path) as db:
+            async with db.execute(
+                "SELECT typeof(u.started_at), typeof(u.created_at), typeof(p.created_at) "
+                "FROM upload_sessions u JOIN processed_data p USING (upload_id)"
+            ) as cursor:
+                assert await cursor.fetchone() == ("integer", "integer", "integer")
+    finally:
+        await session.close_db()
@@ -3,14 +3,45 @@ RAIS Backend - Pipeline Tests
 """
 import pytest
 from pathlib import Path
-from datetime import date
+from datetime import date, datetime
+
+from openpyxl import Workbook
 
 from app.pipelines.parser import (
+    _parse_with_calamine,
+    _parse_with_openpyxl,
     detect_file_type,
     excel_serial_to_date,
     score_row_as_header,
+    ParsedSheet,
+    ParseResult,
+)
+from app.pipelines.computation import (
+    INSPECTED_PATTERNS,
+    REJECTED_PATTERNS,
+    DataAggregator,
+    compute_defect_pareto,
+    compute_kpis,
+    defect_columns,
+    extract_from_inspection,
+    find_column_value,
+    get_month_key,
+    numeric_column,
+    resolve_column,
+    safe_numeric,
+    sheet_month_key,
 )
-from app.models import FileType
+from app.pipelines.validator import (
+    INSPECTION_COLUMNS,
+    ValidationContext,
+    ValidationResult,
+    find_column,
+    negative_mask,
+    numeric_array,
+    resolve_columns,
+    validate_inspection_sheet,
+)
+from app.models import DataSource, FileType
 
 
 class TestFileTypeDetection:
@@ -78,3 +109,173 @@ class TestHeaderScoring:
     def test_empty_row_scores_zero(self):
         assert score_row_as_header([]) == 0
         assert score_row_as_header([None, None, None]) == 0
+
+
+class TestExcelReaders:
+    """The calamine reader must produce the same sheets as the openpyxl fallback"""
+    
+    def test_calamine_matches_openpyxl(self, tmp_path):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "APRIL 25"
+        ws.append(["INSPECTION REPORT", None, None, None])
+        ws.append(["DATE", "INSP QTY", "REJ QTY", "REJ %"])
+        ws.append([datetime(2025, 4, 1), 1000, 12, 1.2])
+        ws.append([datetime(2025, 4, 2, 8, 30), 1500.0, "#DIV/0!", 0.5])
+        ws.append([None, None, None, None])
+        ws.append(["TOTAL", 2500, 12, "  "])
+        ws.merge_cells("A1:D1")
+        wb.create_sheet("SUMMARY").append(["DATE", "QTY"])
+        path = tmp_path / "VISUAL INSPECTION REPORT.xlsx"
+        wb.save(path)
+        
+        expected = _parse_with_openpyxl(str(path), path.name)
+        sheets = _parse_with_calamine(str(path), path.name)
+        
+        assert [s.name for s in sheets] == ["APRIL 25"]
+        for got, want in zip(sheets, expected):
+            assert (got.headers, got.source_rows, got.header_row) == (want.headers, want.source_rows, want.header_row)
+            assert got.columns == want.columns
+            for header in got.headers:
+                assert [type(v) for v in got.columns[header]] == [type(v) for v in want.columns[header]]
+
+
+class TestColumnHelpers:
+    """Test per-sheet column resolution and numeric coercion"""
+    
+    def test_resolve_column_matches_row_lookup(self):
+        row = {"S.NO": 1, "INSP QTY": 10, "REJ QTY": 2, "_source_row": 5}
+        for patterns in (INSPECTED_PATTERNS, REJECTED_PATTERNS, ("MISSING",)):
+            col, _ = find_column_value(row, list(patterns))
+            assert resolve_column(tuple(row), patterns) == col
+    
+    def test_defect_columns_use_first_listed_pattern(self):
+        keys = ("S.NO", "PIN HOLE / BUBBLE", "COAG", "OTHERS", "_source_row")
+        assert defect_columns(keys) == (("PIN HOLE / BUBBLE", "BUBBLE"), ("COAG", "COAG"), ("OTHERS", "OTHER"))
+    
+    def test_numeric_column_matches_safe_numeric(self):
+        values = [5, -3.5, "1,200", " 7 ", "n/a", None, date(2025, 4, 1)]
+        sheet = ParsedSheet("S", ["Q"], {"Q": values}, list(range(2, 9)), 1, "f.xlsx")
+        assert numeric_column(sheet, "Q") == [safe_numeric(v) for v in values]
+        assert numeric_column(sheet, None) == [0.0] * len(values)
+
+
+class TestDataAggregator:
+    """Test the array-backed aggregator"""
+    
+    def test_arrays_grow_with_new_months_and_stages(self):
+        agg = DataAggregator()
+        source = DataSource(file_name="f.xlsx", sheet_name="S1", row_numbers=[2])
+        for i in range(40):
+            month = f"{2020 + i // 12}-{i % 12 + 1:02d}"
+            agg.add_production(month, 100, 90, source)
+            agg.add_stage_data(f"STAGE{i % 6}", month, 10, 8, 2, 10, source)
+            agg.add_defect(f"D{i}", month, 1, source)
+        
+        assert agg.production_months()[0] == "2020-01"
+        assert len(agg.production_months()) == 40
+        assert agg.stage_table(agg.rejected).shape == (6, 40)
+        assert agg.stage_table(agg.rejected).sum() == 80
+        assert agg.defect_table().sum() == 40
+        assert compute_kpis(agg).total_produced == 4000
+    
+    def test_defect_pareto(self):
+        agg = DataAggregator()
+        source = DataSource(file_name="f.xlsx", sheet_name="S1", row_numbers=[2])
+        for code, count in (("THIN", 10), ("COAG", 60), ("WEAK", 10), ("STICKY", 20)):
+            agg.add_defect(code, "2025-04", count, source)
+        
+        pareto = compute_defect_pareto(agg)
+        assert [d.defect_code for d in pareto.defects] == ["COAG", "STICKY", "THIN", "WEAK"]
+        assert [d.cumulative_percentage for d in pareto.defects] == [60.0, 80.0, 90.0, 100.0]
+        assert pareto.threshold_80 == 1
+        assert compute_defect_pareto(DataAggregator()).threshold_80 == 0
+    
+    def test_inspection_skips_rows_without_quantities(self):
+        columns = {"DATE": ["2025-04", "2025-04", None], "REJ QTY": [5, None, None], "COAG": [None, 3, None]}
+        result = ParseResult("VISUAL INSPECTION REPORT.xlsx")
+        result.sheets.append(ParsedSheet("APR 25", list(columns), columns, [2, 3, 4], 1, result.file_name))
+        agg = DataAggregator()
+        extract_from_inspection([result], FileType.VISUAL, agg)
+        
+        assert [s.row_numbers for s in agg.sources] == [[2], [3]]
+        assert agg.total_rejected == 5
+        assert agg.by_defect().tolist() == [3.0]
+        
+        # A stage whose rows carry no quantities is still reported
+        blank = ParseResult("ASSEMBLY REJECTION REPORT.xlsx")
+        blank.sheets.append(ParsedSheet("APR 25", ["REMARKS"], {"REMARKS": ["x"]}, [2], 1, blank.file_name))
+        extract_from_inspection([blank], FileType.ASSEMBLY, agg)
+        assert list(agg.stage_index) == ["VISUAL", "ASSEMBLY"]
+
+
+class TestMonthKey:
+    """Test month key extraction from row values"""
+    
+    def test_text_formats(self):
+        for text in ("April 2025", "apr 2025", "2025-4", "2025-04", "04/2025"):
+            assert get_month_key({"MONTH": text}) == "2025-04"
+    
+    def test_invalid_text(self):
+        for text in ("2025-13", "April 25", "Junee 2025", "2025-04-01"):
+            assert get_month_key({"MONTH": text}) is None
+    
+    def test_date_value(self):
+        assert get_month_key({"DATE": date(2025, 4, 15)}) == "2025-04"
+    
+    def test_sheet_name_month(self):
+        assert sheet_month_key("APRIL 25") == "2025-04"
+        assert sheet_month_key("Visual Sept 2024") == "2024-09"
+        assert sheet_month_key("Sheet1") is None
+
+
+class TestValidationResult:
+    """Test merging per-file validation results"""
+    
+    def test_merge(self):
+        first, second = ValidationResult(), ValidationResult()
+        first.total_rows, first.valid_rows = 10, 10
+        second.total_rows = 5
+        second.add_error("bad", "b.xlsx", "S1", 3)
+        second.valid_rows = second.total_rows - second.error_rows
+        
+        first.merge(second)
+        assert not first.valid
+        assert (first.total_rows, first.valid_rows, first.error_rows) == (15, 14, 1)
+        assert [e.message for e in first.errors] == ["bad"]
+
+
+class TestSheetValidation:
+    """Test whole-sheet validation rules"""
+    
+    def test_resolve_columns_matches_find_column(self):
+        row = {"S.NO": 1, "Rec Qty": 10, "INSP QTY": 10, "PASSED": 9, "_source_row": 2}
+        cols = resolve_columns(tuple(row), INSPECTION_COLUMNS)
+        for name, patterns in INSPECTION_COLUMNS:
+            assert cols[name] == find_column(row, list(patterns))[0]
+        assert cols["rejected"] is None
+    
+    def test_negative_mask_matches_numeric_array(self):
+        values = [None, "-5", "re-check", "1,-2", "-1,200", -0.5, 3, True, date(2025, 4, 1), "ok", "-inf"]
+        mask = negative_mask(values, len(values))
+        assert mask.tolist() == (numeric_array(values, len(values)) < 0).tolist()
+        assert negative_mask([1, -2.0, None], 3).tolist() == [False, True, False]
+    
+    def test_inspection_sheet_flags_rows_in_order(self):
+        columns = {
+            "REC QTY": [100, 100, "1,000", None],
+            "INSP QTY": [100, 90, 50, 10],
+            "ACC QTY": [95, 80, 48, "n/a"],
+            "REJ QTY": [5, 150, 2, 4],
+            "COAG": [None, -3, 0, "-1"],
+        }
+        sheet = ParsedSheet("APR 25", list(columns), columns, [5, 6, 7, 8], 1, "VISUAL.xlsx")
+        result = ValidationResult()
+        validate_inspection_sheet(sheet, result, ValidationContext())
+        
+        assert [(e.source.row_numbers, e.message) for e in result.errors] == [
+            ([6], "Rejected (150.0) exceeds received (100.0)")
+        ]
+        assert [(w.source.row_numbers, w.source.column_name) for w in result.warnings] == [
+            ([6], None), ([6], "COAG"), ([8], "COAG")
+        ]